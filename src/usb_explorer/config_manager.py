@@ -5,15 +5,50 @@ Handles loading and saving of user configuration including custom device names.
 """
 
 from __future__ import annotations
+import asyncio
+import io
 import logging
+import os
+import threading
 from pathlib import Path
-from typing import Optional
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional
 import yaml
 
-from .models import AppConfig, DeviceConfig, PhysicalGroup
+try:
+    from yaml import CSafeLoader as _SafeLoader, CSafeDumper as _SafeDumper
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader, SafeDumper as _SafeDumper  # type: ignore
+
+from .models import AppConfig, DeviceConfig, PhysicalGroup, device_key
 
 logger = logging.getLogger(__name__)
 
+
+class _ConfigDumper(_SafeDumper):
+    """Safe dumper that writes the config models straight to YAML mappings."""
+
+
+def _represent_fields(*names: str) -> Callable[[yaml.BaseDumper, object], yaml.Node]:
+    """Representer emitting the given model fields, in order, as a mapping."""
+    def represent(dumper: yaml.BaseDumper, model: object) -> yaml.Node:
+        return dumper.represent_mapping(
+            "tag:yaml.org,2002:map",
+            [(name, getattr(model, name)) for name in names],
+        )
+    return represent
+
+
+_ConfigDumper.add_representer(
+    AppConfig,
+    _represent_fields("port", "host", "auto_open_browser", "devices", "hub_labels", "physical_groups"),
+)
+_ConfigDumper.add_representer(DeviceConfig, _represent_fields("vendor_id", "product_id", "custom_name", "notes"))
+_ConfigDumper.add_representer(PhysicalGroup, _represent_fields("name", "label", "members"))
+
+# Delay before writing batched configuration changes to disk
+SAVE_DELAY_SECONDS = 2.0
+
 # Use absolute path based on project root
 _PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DEFAULT_CONFIG_PATH = _PROJECT_ROOT / "config" / "devices.yaml"
@@ -25,13 +60,25 @@ class ConfigManager:
     def __init__(self, config_path: Optional[Path] = None):
         self.config_path = config_path or DEFAULT_CONFIG_PATH
         self._config: Optional[AppConfig] = None
+        self._parent_created = False  # Whether save() has made sure the config directory exists
+        self._load_lock = threading.Lock()
         self._device_lookup: dict[str, str] = {}  # "vendor:product" -> custom_name
+        self._device_index: dict[str, DeviceConfig] = {}  # "vendor:product" -> DeviceConfig
+        self._group_by_name: dict[str, PhysicalGroup] = {}  # name -> first group with that name
+        self._member_to_group: dict[str, PhysicalGroup] = {}  # port_path -> first group containing it
+        self._groups_snapshot: tuple[PhysicalGroup, ...] = ()
+        self._version = 0  # Bumped on every change to the configuration
+        self._dirty = False
+        self._save_handle: Optional[asyncio.TimerHandle] = None
 
     @property
     def config(self) -> AppConfig:
         """Get current configuration, loading if necessary."""
         if self._config is None:
-            self.load()
+            with self._load_lock:
+                # Another thread may have finished loading while we waited
+                if self._config is None:
+                    self.load()
         return self._config  # type: ignore
 
     def load(self) -> AppConfig:
@@ -39,7 +86,7 @@ class ConfigManager:
         if self.config_path.exists():
             try:
                 with open(self.config_path) as f:
-                    data = yaml.safe_load(f) or {}
+                    data = yaml.load(f, Loader=_SafeLoader) or {}
 
                 # Parse devices list
                 devices = []
@@ -63,12 +110,14 @@ class ConfigManager:
                     physical_groups=physical_groups,
                 )
 
-                # Build lookup table
-                self._device_lookup = {
-                    f"{d.vendor_id}:{d.product_id}": d.custom_name
+                # Build lookup table (in place, so views handed out stay current)
+                self._device_lookup.clear()
+                self._device_lookup.update(
+                    (d.key, d.custom_name)
                     for d in devices
                     if d.custom_name
-                }
+                )
+                self._device_index = {d.key: d for d in devices}
 
                 logger.info(f"Loaded configuration from {self.config_path}")
 
@@ -79,179 +128,216 @@ class ConfigManager:
             logger.info(f"No config file found at {self.config_path}, using defaults")
             self._config = AppConfig()
 
+        self._index_groups(self._config.physical_groups)
         return self._config
 
+    def _index_groups(self, groups: list[PhysicalGroup]) -> None:
+        """Rebuild the group lookup tables and snapshot after physical_groups changed.
+
+        Earlier groups win, matching a first-match scan of the list.
+        """
+        by_name: dict[str, PhysicalGroup] = {}
+        member_to_group: dict[str, PhysicalGroup] = {}
+        for group in groups:
+            by_name.setdefault(group.name, group)
+            for member in group.members:
+                member_to_group.setdefault(member, group)
+        self._group_by_name = by_name
+        self._member_to_group = member_to_group
+        self._groups_snapshot = tuple(groups)
+
+    @property
+    def version(self) -> int:
+        """Counter that changes whenever the configuration is modified."""
+        return self._version
+
     def save(self) -> None:
         """Save current configuration to file."""
         if self._config is None:
             return
 
-        # Ensure directory exists
-        self.config_path.parent.mkdir(parents=True, exist_ok=True)
-
-        data = {
-            "port": self._config.port,
-            "host": self._config.host,
-            "auto_open_browser": self._config.auto_open_browser,
-            "devices": [
-                {
-                    "vendor_id": d.vendor_id,
-                    "product_id": d.product_id,
-                    "custom_name": d.custom_name,
-                    "notes": d.notes,
-                }
-                for d in self._config.devices
-            ],
-            "hub_labels": self._config.hub_labels,
-            "physical_groups": [
-                {
-                    "name": g.name,
-                    "label": g.label,
-                    "members": g.members,
-                }
-                for g in self._config.physical_groups
-            ],
-        }
+        self._version += 1
+
+        # Ensure directory exists (once; it isn't expected to vanish while running)
+        if not self._parent_created:
+            self.config_path.parent.mkdir(parents=True, exist_ok=True)
+            self._parent_created = True
 
         try:
-            with open(self.config_path, "w") as f:
-                yaml.dump(data, f, default_flow_style=False, sort_keys=False)
+            # Render in memory, then write a temp file, sync it and rename it
+            # over the config so a crash or power loss mid-write can't leave
+            # a truncated or empty file
+            buf = io.StringIO()
+            yaml.dump(self._config, buf, Dumper=_ConfigDumper, default_flow_style=False, sort_keys=False)
+            tmp_path = self.config_path.with_suffix(self.config_path.suffix + ".tmp")
+            with open(tmp_path, "w") as f:
+                f.write(buf.getvalue())
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_path.replace(self.config_path)
             logger.info(f"Saved configuration to {self.config_path}")
         except Exception as e:
             logger.exception(f"Error saving config to {self.config_path}: {e}")
 
+    def _mark_dirty(self) -> None:
+        """Schedule a deferred save so bursts of edits result in a single write.
+
+        Falls back to saving immediately when there's no running event loop.
+        """
+        self._version += 1
+        self._dirty = True
+        if self._save_handle is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+
+        self._save_handle = loop.call_later(SAVE_DELAY_SECONDS, self.flush)
+
+    def flush(self) -> None:
+        """Write pending changes to disk, if any."""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+
+        if self._dirty:
+            self._dirty = False
+            self.save()
+
     def get_device_name(self, vendor_id: str, product_id: str) -> Optional[str]:
         """Get custom name for a device if configured."""
-        key = f"{vendor_id}:{product_id}"
+        self.config  # Ensure the lookup table has been built
+        key = device_key(vendor_id, product_id)
         return self._device_lookup.get(key)
 
-    def get_device_lookup(self) -> dict[str, str]:
-        """Get the full vendor:product -> name lookup table."""
-        if self._config is None:
-            self.load()
-        return self._device_lookup.copy()
+    def get_device_lookup(self) -> Mapping[str, str]:
+        """Get a read-only, live view of the vendor:product -> name lookup table.
 
-    def get_hub_labels(self) -> dict[str, str]:
-        """Get the hub labels configuration."""
-        if self._config is None:
-            self.load()
-        return self._config.hub_labels.copy()  # type: ignore
+        The view reflects later set_device_name/remove_device_name calls, so
+        callers don't need to fetch it again after a change.
+        """
+        self.config  # Ensure the lookup table has been built
+        return MappingProxyType(self._device_lookup)
+
+    def get_hub_labels(self) -> Mapping[str, str]:
+        """Get a read-only, live view of the hub labels configuration."""
+        return MappingProxyType(self.config.hub_labels)
 
     def set_hub_label(self, key: str, label: Optional[str]) -> None:
         """Set or remove a hub label."""
-        if self._config is None:
-            self.load()
+        hub_labels = self.config.hub_labels
 
         if label:
-            self._config.hub_labels[key] = label  # type: ignore
+            hub_labels[key] = label
         else:
-            self._config.hub_labels.pop(key, None)  # type: ignore
+            hub_labels.pop(key, None)
 
-        self.save()
+        self._mark_dirty()
 
     def set_device_name(self, vendor_id: str, product_id: str, name: str) -> None:
         """Set custom name for a device."""
-        if self._config is None:
-            self.load()
+        config = self.config
 
-        key = f"{vendor_id}:{product_id}"
+        key = device_key(vendor_id, product_id)
 
         # Update or add device config
-        for device in self._config.devices:  # type: ignore
-            if device.vendor_id == vendor_id and device.product_id == product_id:
-                device.custom_name = name
-                break
+        device = self._device_index.get(key)
+        if device is None:
+            device = DeviceConfig(vendor_id=vendor_id, product_id=product_id, custom_name=name)
+            config.devices.append(device)
+            self._device_index[key] = device
         else:
-            self._config.devices.append(  # type: ignore
-                DeviceConfig(vendor_id=vendor_id, product_id=product_id, custom_name=name)
-            )
+            device.custom_name = name
 
         self._device_lookup[key] = name
-        self.save()
+        self._mark_dirty()
 
     def remove_device_name(self, vendor_id: str, product_id: str) -> None:
         """Remove custom name for a device."""
-        if self._config is None:
-            self.load()
+        config = self.config
 
-        key = f"{vendor_id}:{product_id}"
+        key = device_key(vendor_id, product_id)
         self._device_lookup.pop(key, None)
 
-        self._config.devices = [  # type: ignore
-            d for d in self._config.devices  # type: ignore
-            if not (d.vendor_id == vendor_id and d.product_id == product_id)
-        ]
-        self.save()
+        device = self._device_index.pop(key, None)
+        if device is not None:
+            config.devices.remove(device)
+        self._mark_dirty()
 
-    def get_physical_groups(self) -> list[PhysicalGroup]:
-        """Get all physical device groups."""
-        if self._config is None:
-            self.load()
-        return self._config.physical_groups.copy()  # type: ignore
+    def get_physical_groups(self) -> tuple[PhysicalGroup, ...]:
+        """Get all physical device groups.
+
+        Returns a snapshot that is replaced, not modified, when the groups change.
+        """
+        self.config  # Ensure the snapshot has been built
+        return self._groups_snapshot
 
     def add_physical_group(self, name: str, members: list[str], label: Optional[str] = None) -> PhysicalGroup:
         """Add a new physical device group."""
-        if self._config is None:
-            self.load()
-
-        # Check for existing group with overlapping members
-        for group in self._config.physical_groups:  # type: ignore
-            overlap = set(group.members) & set(members)
-            if overlap:
-                # Remove overlapping members from existing group
-                group.members = [m for m in group.members if m not in overlap]
-                # If group is now empty, remove it
+        physical_groups = self.config.physical_groups
+
+        # Take the new group's members out of any existing group
+        incoming = frozenset(members)
+        groups = []
+        for group in physical_groups:
+            if any(m in incoming for m in group.members):
+                group.members = [m for m in group.members if m not in incoming]
+                # If group is now empty, drop it
                 if not group.members:
-                    self._config.physical_groups.remove(group)  # type: ignore
+                    continue
+            groups.append(group)
+        physical_groups[:] = groups
 
         new_group = PhysicalGroup(name=name, members=members, label=label)
-        self._config.physical_groups.append(new_group)  # type: ignore
-        self.save()
+        physical_groups.append(new_group)
+        self._index_groups(physical_groups)
+        self._mark_dirty()
         return new_group
 
     def update_physical_group(self, old_name: str, name: str, label: Optional[str] = None) -> Optional[PhysicalGroup]:
         """Update an existing physical group's name or label."""
-        if self._config is None:
-            self.load()
+        physical_groups = self.config.physical_groups
 
-        for group in self._config.physical_groups:  # type: ignore
-            if group.name == old_name:
-                group.name = name
-                group.label = label
-                self.save()
-                return group
-        return None
+        group = self._group_by_name.get(old_name)
+        if group is None:
+            return None
+        group.name = name
+        group.label = label
+        self._index_groups(physical_groups)
+        self._mark_dirty()
+        return group
 
     def remove_physical_group(self, name: str) -> bool:
         """Remove a physical group by name."""
-        if self._config is None:
-            self.load()
+        physical_groups = self.config.physical_groups
 
-        for group in self._config.physical_groups:  # type: ignore
-            if group.name == name:
-                self._config.physical_groups.remove(group)  # type: ignore
-                self.save()
-                return True
-        return False
+        group = self._group_by_name.get(name)
+        if group is None:
+            return False
+        physical_groups.remove(group)
+        self._index_groups(physical_groups)
+        self._mark_dirty()
+        return True
 
     def find_physical_group_for_device(self, port_path: str) -> Optional[PhysicalGroup]:
         """Find the physical group that contains a device."""
-        if self._config is None:
-            self.load()
-
-        for group in self._config.physical_groups:  # type: ignore
-            if port_path in group.members:
-                return group
-        return None
+        self.config  # Ensure the lookup tables have been built
+        return self._member_to_group.get(port_path)
 
 
 # Global config manager instance
 _config_manager: Optional[ConfigManager] = None
+_config_manager_lock = threading.Lock()
 
 
 def get_config_manager(config_path: Optional[Path] = None) -> ConfigManager:
     """Get or create the global config manager."""
     global _config_manager
     if _config_manager is None:
-        _config_manager = ConfigManager(config_path)
+        with _config_manager_lock:
+            if _config_manager is None:
+                _config_manager = ConfigManager(config_path)
     return _config_manager
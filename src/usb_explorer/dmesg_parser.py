@@ -6,12 +6,16 @@ Monitors kernel messages for USB errors and associates them with devices.
 
 from __future__ import annotations
 import asyncio
+import heapq
 import logging
+import os
 import re
 import subprocess
-from dataclasses import dataclass
+import threading
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Callable, Optional
+from typing import Callable, Iterable, Mapping, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -24,9 +28,23 @@ class USBError:
     message: str
     raw_line: str
     severity: str = "error"  # error, warning, info
+    port_tuple: tuple[str, ...] = field(init=False, repr=False, compare=False)
 
+    def __post_init__(self) -> None:
+        self.port_tuple = split_port_path(self.port_path)
 
-# Patterns to match USB errors in dmesg
+
+def split_port_path(port_path: str) -> tuple[str, ...]:
+    """Split a port path into its components, e.g. "5-1.2.4" -> ("5", "1", "2", "4").
+
+    A port path is a prefix of another exactly when its tuple is a prefix of
+    the other's tuple, so ancestry checks need no string building.
+    """
+    bus, _, ports = port_path.partition("-")
+    return (bus, *ports.split(".")) if ports else (bus,)
+
+
+# Patterns to match USB errors in dmesg: (regex, description)
 USB_ERROR_PATTERNS = [
     # Device errors
     (r"usb (\d+-[\d.]+): device descriptor read.*, error (-?\d+)", "Device descriptor read failed"),
@@ -52,96 +70,215 @@ USB_ERROR_PATTERNS = [
     (r"usb (\d+-[\d.]+): reset.*failed", "Reset failed"),
 ]
 
-# Compiled patterns
-COMPILED_PATTERNS = [(re.compile(p), desc) for p, desc in USB_ERROR_PATTERNS]
+# All patterns unioned into a single alternation so each line is scanned once.
+# Each alternative is wrapped in a named group "p<index>"; since the wrapper is
+# the outermost group to close, ``match.lastgroup`` identifies the alternative
+# and ``match.lastindex + 1`` is its first inner capture (the port path).
+_COMBINED_PATTERN = re.compile(
+    "|".join(f"(?P<p{i}>{p})" for i, (p, _) in enumerate(USB_ERROR_PATTERNS))
+)
+_PATTERN_DESCRIPTIONS = {f"p{i}": desc for i, (_, desc) in enumerate(USB_ERROR_PATTERNS)}
+
+# Case-insensitive "usb" check that doesn't allocate a lowered copy of the line
+_USB_FASTPATH = re.compile(r"[Uu][Ss][Bb]").search
+
+# Words that downgrade a matched line from an error
+_DISCONNECT_WORD = re.compile(r"disconnect", re.IGNORECASE).search
+_WARNING_WORD = re.compile(r"warning", re.IGNORECASE).search
 
 
 def parse_dmesg_line(line: str) -> Optional[USBError]:
     """Parse a single dmesg line for USB errors."""
     # Skip non-USB lines quickly
-    if "usb" not in line.lower():
+    if not _USB_FASTPATH(line):
+        return None
+
+    match = _COMBINED_PATTERN.search(line)
+    if not match:
         return None
 
-    # Try each pattern
-    for pattern, description in COMPILED_PATTERNS:
-        match = pattern.search(line)
-        if match:
-            port_path = match.group(1)
-
-            # Normalise port path
-            # Convert "usb5-port1" -> "5-1" style if needed
-            if port_path.startswith("usb") and "-port" in port_path:
-                parts = port_path.replace("usb", "").split("-port")
-                if len(parts) == 2:
-                    port_path = f"{parts[0]}-{parts[1]}"
-
-            # Determine severity
-            severity = "error"
-            if "disconnect" in line.lower():
-                severity = "info"
-            elif "warning" in line.lower():
-                severity = "warning"
-
-            return USBError(
-                timestamp=datetime.now().timestamp(),
-                port_path=port_path,
-                message=description,
-                raw_line=line.strip(),
-                severity=severity,
+    description = _PATTERN_DESCRIPTIONS[match.lastgroup]  # type: ignore[index]
+    severity = "error"
+    if _DISCONNECT_WORD(line):
+        severity = "info"
+    elif _WARNING_WORD(line):
+        severity = "warning"
+    port_path = match.group(match.lastindex + 1)  # type: ignore[operator]
+
+    # Normalise port path
+    # Convert "usb5-port1" -> "5-1" style if needed
+    if port_path.startswith("usb") and "-port" in port_path:
+        parts = port_path.replace("usb", "").split("-port")
+        if len(parts) == 2:
+            port_path = f"{parts[0]}-{parts[1]}"
+
+    return USBError(
+        timestamp=datetime.now().timestamp(),
+        port_path=port_path,
+        message=description,
+        raw_line=line.strip(),
+        severity=severity,
+    )
+
+
+# Short-lived cache of dmesg output so overlapping callers (page load, API
+# requests, the monitor poll) share a single subprocess run
+_DMESG_CACHE_TTL = 1.0
+_dmesg_cache: Optional[tuple[float, list[str]]] = None
+_dmesg_cache_lock = threading.Lock()
+
+
+def _read_dmesg_lines() -> list[str]:
+    """Run dmesg and return its output lines, reusing output younger than the TTL."""
+    global _dmesg_cache
+
+    with _dmesg_cache_lock:
+        now = time.monotonic()
+        if _dmesg_cache is not None and now - _dmesg_cache[0] < _DMESG_CACHE_TTL:
+            return _dmesg_cache[1]
+
+        all_lines: list[str] = []
+        try:
+            result = subprocess.run(
+                ["dmesg", "--time-format=iso"],
+                capture_output=True,
+                text=True,
+                timeout=5,
             )
 
-    return None
+            if result.returncode != 0:
+                # Try without sudo (may have limited access)
+                result = subprocess.run(
+                    ["dmesg"],
+                    capture_output=True,
+                    text=True,
+                    timeout=5,
+                )
+
+            if result.stdout:
+                all_lines = result.stdout.strip().split("\n")
+
+        except subprocess.TimeoutExpired:
+            logger.warning("dmesg command timed out")
+        except subprocess.SubprocessError as e:
+            logger.exception(f"Error running dmesg: {e}")
+
+        _dmesg_cache = (now, all_lines)
+        return all_lines
 
 
 def get_recent_usb_errors(lines: int = 100) -> list[USBError]:
     """Get recent USB errors from dmesg."""
     errors: list[USBError] = []
 
-    try:
-        result = subprocess.run(
-            ["dmesg", "--time-format=iso"],
-            capture_output=True,
-            text=True,
-            timeout=5,
-        )
+    # Process last N lines
+    for line in _read_dmesg_lines()[-lines:]:
+        error = parse_dmesg_line(line)
+        if error:
+            errors.append(error)
 
-        if result.returncode != 0:
-            # Try without sudo (may have limited access)
-            result = subprocess.run(
-                ["dmesg"],
-                capture_output=True,
-                text=True,
-                timeout=5,
-            )
+    return errors
 
-        if result.stdout:
-            # Process last N lines
-            all_lines = result.stdout.strip().split("\n")
-            for line in all_lines[-lines:]:
-                error = parse_dmesg_line(line)
-                if error:
-                    errors.append(error)
 
-    except subprocess.TimeoutExpired:
-        logger.warning("dmesg command timed out")
-    except subprocess.SubprocessError as e:
-        logger.exception(f"Error running dmesg: {e}")
+# Port path -> (position in the error log, formatted message), in logged order
+ErrorIndex = Mapping[str, list[tuple[int, str]]]
 
-    return errors
+
+def index_errors(errors: Iterable[USBError]) -> dict[str, list[tuple[int, str]]]:
+    """Group formatted error messages by the port path they were reported on."""
+    index: dict[str, list[tuple[int, str]]] = {}
+    for position, error in enumerate(errors):
+        index.setdefault(error.port_path, []).append(
+            (position, f"[{error.severity.upper()}] {error.message}")
+        )
+    return index
+
+
+def errors_for_port(error_index: ErrorIndex, port_path: str) -> list[str]:
+    """Get error messages for a device from an index built by index_errors().
+
+    A device picks up errors reported on its own port path and on any of its
+    parent port paths (e.g. "5-1.2.4" also matches "5-1.2" and "5-1"), in
+    the order they were logged.
+    """
+    if not error_index:
+        return []
+
+    groups: list[list[tuple[int, str]]] = []
+    path = port_path
+    while True:
+        group = error_index.get(path)
+        if group:
+            groups.append(group)
+        dot = path.rfind(".")
+        if dot < 0:
+            break
+        path = path[:dot]
+
+    if not groups:
+        return []
+    # Each group is already in logged order, so a merge restores the overall order
+    entries = groups[0] if len(groups) == 1 else heapq.merge(*groups)
+    # Drop repeats of the same message, keeping first-seen order
+    return list(dict.fromkeys(message for _, message in entries))
 
 
 def get_errors_for_device(port_path: str, errors: Optional[list[USBError]] = None) -> list[str]:
-    """Get error messages for a specific device."""
+    """Get error messages for a specific device, without repeats.
+
+    For many devices, build the index once and use errors_for_port() instead.
+    """
     if errors is None:
         errors = get_recent_usb_errors()
+    return errors_for_port(index_errors(errors), port_path)
+
 
-    device_errors = []
-    for error in errors:
-        # Match exact path or parent path
-        if error.port_path == port_path or port_path.startswith(error.port_path + "."):
-            device_errors.append(f"[{error.severity.upper()}] {error.message}")
+KMSG_PATH = "/dev/kmsg"
 
-    return device_errors
+
+class _KmsgReader:
+    """Non-blocking reader for new records in the kernel log via /dev/kmsg.
+
+    The descriptor is positioned at the end of the log on open, so only
+    messages logged afterwards are returned. Each read() yields exactly one
+    record of the form "<prio>,<seq>,<usec>,<flags>;<message>".
+    """
+
+    def __init__(self, path: str = KMSG_PATH):
+        self._fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        os.lseek(self._fd, 0, os.SEEK_END)
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def drain(self) -> list[str]:
+        """Read all pending records, formatted like plain `dmesg` output lines."""
+        lines: list[str] = []
+        while True:
+            try:
+                record = os.read(self._fd, 8192)
+            except BlockingIOError:
+                break
+            except BrokenPipeError:
+                # Unread records were overwritten; the next read resumes
+                continue
+
+            if not record:
+                break
+
+            header, _, message = record.decode("utf-8", "replace").partition(";")
+            fields = header.split(",")
+            try:
+                seconds = int(fields[2]) / 1_000_000
+            except (IndexError, ValueError):
+                seconds = 0.0
+            # Continuation lines (key=value metadata) follow the first newline
+            lines.append(f"[{seconds:12.6f}] {message.split(chr(10), 1)[0]}")
+
+        return lines
+
+    def close(self) -> None:
+        os.close(self._fd)
 
 
 class DmesgMonitor:
@@ -149,17 +286,23 @@ class DmesgMonitor:
 
     def __init__(self):
         self._running = False
-        self._callbacks: list[Callable[[USBError], None]] = []
+        # Replaced rather than mutated, so emitting iterates a stable snapshot
+        self._callbacks: tuple[Callable[[USBError], None], ...] = ()
         self._last_errors: list[USBError] = []
+        self._seen_lines: set[str] = set()
+        self._error_version = 0  # Bumped whenever a new error is recorded
+        self._error_index: tuple[int, ErrorIndex] = (0, {})  # (version, index)
 
     def register_callback(self, callback: Callable[[USBError], None]) -> None:
         """Register callback for new errors."""
-        self._callbacks.append(callback)
+        self._callbacks += (callback,)
 
     def unregister_callback(self, callback: Callable[[USBError], None]) -> None:
         """Unregister callback."""
         if callback in self._callbacks:
-            self._callbacks.remove(callback)
+            callbacks = list(self._callbacks)
+            callbacks.remove(callback)
+            self._callbacks = tuple(callbacks)
 
     def _emit_error(self, error: USBError) -> None:
         """Emit error to callbacks."""
@@ -179,37 +322,126 @@ class DmesgMonitor:
 
         # Get initial errors to avoid duplicates
         self._last_errors = get_recent_usb_errors(200)
-        seen_lines = {e.raw_line for e in self._last_errors}
+        self._seen_lines = {e.raw_line for e in self._last_errors}
+        self._error_version += 1
+
+        try:
+            # Prefer reading /dev/kmsg directly, then a streaming dmesg process
+            for follow in (self._follow_kmsg, self._follow_dmesg):
+                try:
+                    await follow()
+                except Exception as e:
+                    logger.warning(f"Cannot stream kernel log via {follow.__name__}: {e}")
+
+                if not self._running:
+                    break
+
+            if self._running:
+                # Streaming unavailable (restricted kernel log, old util-linux, ...)
+                await self._poll_dmesg()
+        finally:
+            # Cancellation propagates, so the task is marked cancelled
+            self._running = False
+            logger.info("dmesg monitoring stopped")
+
+    def _record_error(self, error: USBError) -> None:
+        """Store and emit an error unless it has been seen before."""
+        if error.raw_line in self._seen_lines:
+            return
 
+        self._seen_lines.add(error.raw_line)
+        self._last_errors.append(error)
+        self._error_version += 1
+        self._emit_error(error)
+
+        # Limit stored errors
+        if len(self._last_errors) > 500:
+            self._last_errors = self._last_errors[-200:]
+            self._seen_lines = {e.raw_line for e in self._last_errors}
+
+    async def _follow_kmsg(self) -> None:
+        """Read new kernel messages from /dev/kmsg as they are logged."""
+        reader = _KmsgReader()
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(reader.fileno(), readable.set)
+
+        try:
+            while self._running:
+                await readable.wait()
+                readable.clear()
+                for line in reader.drain():
+                    error = parse_dmesg_line(line)
+                    if error:
+                        self._record_error(error)
+        finally:
+            loop.remove_reader(reader.fileno())
+            reader.close()
+
+    async def _follow_dmesg(self) -> None:
+        """Stream new kernel messages with `dmesg --follow`, parsing each line once."""
+        # --follow replays the whole ring buffer before streaming, so every
+        # error already in it is marked as seen, not just the recent tail
+        self._seen_lines.update(
+            error.raw_line
+            for error in map(parse_dmesg_line, _read_dmesg_lines())
+            if error
+        )
+
+        proc = await asyncio.create_subprocess_exec(
+            "dmesg", "--follow", "--time-format=iso",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+        try:
+            async for raw in proc.stdout:  # type: ignore[union-attr]
+                if not self._running:
+                    break
+                error = parse_dmesg_line(raw.decode("utf-8", "replace"))
+                if error:
+                    self._record_error(error)
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+
+        if self._running:
+            logger.warning(f"dmesg --follow exited with status {proc.returncode}")
+
+    async def _poll_dmesg(self) -> None:
+        """Poll the tail of dmesg for new errors every 2 seconds."""
         while self._running:
             try:
-                # Poll for new errors every 2 seconds
                 await asyncio.sleep(2)
 
-                new_errors = get_recent_usb_errors(50)
-                for error in new_errors:
-                    if error.raw_line not in seen_lines:
-                        seen_lines.add(error.raw_line)
-                        self._last_errors.append(error)
-                        self._emit_error(error)
-
-                # Limit stored errors
-                if len(self._last_errors) > 500:
-                    self._last_errors = self._last_errors[-200:]
-                    seen_lines = {e.raw_line for e in self._last_errors}
+                for error in get_recent_usb_errors(50):
+                    self._record_error(error)
 
-            except asyncio.CancelledError:
-                break
             except Exception as e:
                 logger.exception(f"Error in dmesg monitor: {e}")
                 await asyncio.sleep(5)
 
-        logger.info("dmesg monitoring stopped")
-
     def stop_monitoring(self) -> None:
         """Stop monitoring."""
         self._running = False
 
+    @property
+    def error_version(self) -> int:
+        """Counter that changes whenever a new error is seen."""
+        return self._error_version
+
     def get_cached_errors(self) -> list[USBError]:
         """Get cached errors."""
         return self._last_errors.copy()
+
+    def get_error_index(self) -> ErrorIndex:
+        """Get the cached errors indexed by port path, for errors_for_port().
+
+        The index is rebuilt only after new errors have been recorded.
+        """
+        version, index = self._error_index
+        if version != self._error_version:
+            index = index_errors(self._last_errors)
+            self._error_index = (self._error_version, index)
+        return index
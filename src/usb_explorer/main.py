@@ -12,17 +12,18 @@ import signal
 import sys
 from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
+import orjson
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 from .models import USBEvent, EventType
-from .usb_monitor import USBMonitor
-from .dmesg_parser import DmesgMonitor, get_errors_for_device, get_recent_usb_errors
+from .usb_monitor import USBMonitor, _open_authorized, _set_authorized
+from .dmesg_parser import DmesgMonitor, ErrorIndex, USBError, errors_for_port, get_recent_usb_errors
 from .config_manager import get_config_manager, ConfigManager
 from .websocket_manager import get_ws_manager, WebSocketManager
 
@@ -44,25 +45,29 @@ dmesg_monitor: DmesgMonitor | None = None
 config_manager: ConfigManager | None = None
 ws_manager: WebSocketManager | None = None
 main_loop: asyncio.AbstractEventLoop | None = None
+# uvicorn.Server, when the app was started through run_server()
+_server: Any = None
 
 # Background tasks
 _background_tasks: list[asyncio.Task] = []
 
+# Last serialized device tree, keyed by (tree, dmesg error, config) versions
+_tree_cache: tuple[tuple[int, int, int], bytes] | None = None
+# FULL_TREE WebSocket message rendered from the cached tree JSON
+_full_tree_cache: tuple[bytes, str] | None = None
+
 
 def handle_usb_event(event: USBEvent) -> None:
     """Handle USB events from the monitor (called from background thread)."""
     if main_loop is None or ws_manager is None:
         return
 
-    # Schedule the coroutine on the main event loop from this background thread
-    main_loop.call_soon_threadsafe(
-        lambda: main_loop.create_task(ws_manager.broadcast_event(event))
-    )
+    # Hand the event to the main loop's broadcast queue from this background thread
+    main_loop.call_soon_threadsafe(ws_manager.queue_event, event)
 
 
 def handle_dmesg_error(error: Any) -> None:
     """Handle dmesg errors (called from background thread)."""
-    from .dmesg_parser import USBError
     if not isinstance(error, USBError):
         return
 
@@ -76,10 +81,8 @@ def handle_dmesg_error(error: Any) -> None:
         error_message=error.message,
     )
 
-    # Schedule the coroutine on the main event loop from this background thread
-    main_loop.call_soon_threadsafe(
-        lambda e=event: main_loop.create_task(ws_manager.broadcast_event(e))
-    )
+    # Hand the event to the main loop's broadcast queue from this background thread
+    main_loop.call_soon_threadsafe(ws_manager.queue_event, event)
 
 
 @asynccontextmanager
@@ -105,7 +108,8 @@ async def lifespan(app: FastAPI):
     # Start background monitoring tasks
     usb_task = asyncio.create_task(usb_monitor.start_monitoring())
     dmesg_task = asyncio.create_task(dmesg_monitor.start_monitoring())
-    _background_tasks.extend([usb_task, dmesg_task])
+    sender_task = asyncio.create_task(ws_manager.run_event_sender())
+    _background_tasks.extend([usb_task, dmesg_task, sender_task])
 
     logger.info("USB Explorer started successfully")
 
@@ -116,6 +120,7 @@ async def lifespan(app: FastAPI):
 
     usb_monitor.stop_monitoring()
     dmesg_monitor.stop_monitoring()
+    config_manager.flush()
 
     for task in _background_tasks:
         task.cancel()
@@ -156,18 +161,7 @@ async def websocket_endpoint(websocket: WebSocket):
 
     try:
         # Send initial device tree
-        devices = usb_monitor.get_tree()  # type: ignore
-
-        # Add errors to devices
-        errors = get_recent_usb_errors(200)
-        for device in devices:
-            _add_errors_to_tree(device, errors)
-
-        initial_event = USBEvent(
-            type=EventType.FULL_TREE,
-            devices=devices,
-        )
-        await websocket.send_json(initial_event.to_websocket_message())
+        await websocket.send_text(_full_tree_message())
 
         # Keep connection alive and handle incoming messages
         while True:
@@ -183,12 +177,65 @@ async def websocket_endpoint(websocket: WebSocket):
         await ws_manager.disconnect(websocket)  # type: ignore
 
 
-def _add_errors_to_tree(device: Any, errors: list) -> None:
-    """Recursively add errors to device tree."""
-    device.errors = get_errors_for_device(device.port_path, errors)
-    device.has_errors = len(device.errors) > 0
-    for child in device.children:
-        _add_errors_to_tree(child, errors)
+def _get_tree_json() -> bytes:
+    """Get the device tree, with errors attached, serialized as a JSON array.
+
+    The result is reused until the topology, the dmesg errors or the config
+    change, so concurrent page loads and API polls share a single scan.
+    """
+    global _tree_cache
+
+    cache_key = (
+        usb_monitor.tree_version,  # type: ignore
+        dmesg_monitor.error_version,  # type: ignore
+        config_manager.version,  # type: ignore
+    )
+    if _tree_cache is not None and _tree_cache[0] == cache_key:
+        return _tree_cache[1]
+
+    devices = usb_monitor.get_tree()  # type: ignore
+    error_index = dmesg_monitor.get_error_index()  # type: ignore
+    for device in devices:
+        _add_errors_to_tree(device, error_index)
+
+    payload = orjson.dumps([d.model_dump_for_frontend() for d in devices])
+    _tree_cache = (cache_key, payload)
+    return payload
+
+
+def _full_tree_message() -> str:
+    """Build the FULL_TREE WebSocket message around the cached tree JSON.
+
+    The rendered message is kept until the tree JSON changes, so every
+    client connecting in between is sent the same string.
+    """
+    global _full_tree_cache
+
+    payload = _get_tree_json()
+    if _full_tree_cache is not None and _full_tree_cache[0] is payload:
+        return _full_tree_cache[1]
+
+    # Equivalent to USBEvent(type=FULL_TREE, devices=...).to_websocket_message(),
+    # but splices in the already-serialized tree instead of re-encoding it
+    message = (
+        b'{"type":"' + EventType.FULL_TREE.value.encode() + b'","timestamp":0.0,"data":'
+        + payload
+        + b"}"
+    ).decode()
+    _full_tree_cache = (payload, message)
+    return message
+
+
+def _add_errors_to_tree(device: Any, error_index: ErrorIndex) -> None:
+    """Add errors to a device and all of its descendants."""
+    stack = [device]
+    while stack:
+        device = stack.pop()
+        stack.extend(device.children)
+        device_errors = errors_for_port(error_index, device.port_path)
+        if device.errors != device_errors:
+            device.errors = device_errors
+            device.invalidate_cache()
 
 
 async def handle_client_message(websocket: WebSocket, data: dict) -> None:
@@ -196,14 +243,10 @@ async def handle_client_message(websocket: WebSocket, data: dict) -> None:
     action = data.get("action")
 
     if action == "refresh":
-        # Send fresh device tree
-        devices = usb_monitor.get_tree()  # type: ignore
-        errors = get_recent_usb_errors(200)
-        for device in devices:
-            _add_errors_to_tree(device, errors)
-
-        event = USBEvent(type=EventType.FULL_TREE, devices=devices)
-        await websocket.send_json(event.to_websocket_message())
+        # Rescan so the client sees current sysfs state, then send the tree
+        if usb_monitor is not None:
+            await usb_monitor.rescan()
+        await websocket.send_text(_full_tree_message())
 
     elif action == "set_name":
         vendor_id = data.get("vendor_id")
@@ -211,9 +254,8 @@ async def handle_client_message(websocket: WebSocket, data: dict) -> None:
         name = data.get("name")
 
         if vendor_id and product_id and name:
+            # USB monitor holds a live view of the lookup, so it sees this immediately
             config_manager.set_device_name(vendor_id, product_id, name)  # type: ignore
-            # Update USB monitor's lookup
-            usb_monitor.config_lookup = config_manager.get_device_lookup()  # type: ignore
             await websocket.send_json({"type": "name_updated", "success": True})
 
     elif action == "reset_device":
@@ -226,48 +268,45 @@ async def handle_client_message(websocket: WebSocket, data: dict) -> None:
 async def reset_usb_device(port_path: str) -> bool:
     """Reset a USB device by toggling its authorized state."""
     try:
-        # Find the device's sysfs path
-        base_path = Path(f"/sys/bus/usb/devices/{port_path}")
-
-        if not base_path.exists():
-            logger.warning(f"Device path not found: {base_path}")
-            return False
-
-        authorized_path = base_path / "authorized"
-        if not authorized_path.exists():
-            logger.warning(f"Cannot reset device: {authorized_path} not found")
-            return False
-
-        # Toggle authorized state
-        logger.info(f"Resetting USB device at {port_path}")
+        # One descriptor for both writes; the attribute stays put while the
+        # device is deauthorized. Opening it is also the existence check.
+        fd = _open_authorized(port_path)
+    except FileNotFoundError:
+        logger.warning(f"Cannot reset device: {port_path} not found in sysfs")
+        return False
+    except PermissionError:
+        logger.error(f"Permission denied resetting device {port_path}. Run with sudo.")
+        return False
+    except OSError as e:
+        logger.error(f"Cannot open authorized attribute of {port_path}: {e}")
+        return False
 
+    # Toggle authorized state
+    logger.info(f"Resetting USB device at {port_path}")
+    try:
         # Disable
-        authorized_path.write_text("0")
+        await _set_authorized(fd, b"0")
         await asyncio.sleep(0.5)
 
         # Re-enable
-        authorized_path.write_text("1")
-
-        logger.info(f"USB device reset complete: {port_path}")
-        return True
-
+        await _set_authorized(fd, b"1")
     except PermissionError:
         logger.error(f"Permission denied resetting device {port_path}. Run with sudo.")
         return False
     except Exception as e:
         logger.exception(f"Error resetting device {port_path}: {e}")
         return False
+    finally:
+        os.close(fd)
+
+    logger.info(f"USB device reset complete: {port_path}")
+    return True
 
 
 @app.get("/api/devices")
 async def get_devices():
     """Get current USB device tree as JSON."""
-    devices = usb_monitor.get_tree()  # type: ignore
-    errors = get_recent_usb_errors(200)
-    for device in devices:
-        _add_errors_to_tree(device, errors)
-
-    return JSONResponse([d.model_dump_for_frontend() for d in devices])
+    return Response(content=_get_tree_json(), media_type="application/json")
 
 
 @app.get("/api/device/{port_path:path}")
@@ -275,10 +314,12 @@ async def get_device(port_path: str):
     """Get a specific device by port path."""
     device = usb_monitor.get_device(port_path)  # type: ignore
     if device:
-        errors = get_recent_usb_errors(100)
-        device.errors = get_errors_for_device(port_path, errors)
-        device.has_errors = len(device.errors) > 0
-        return JSONResponse(device.model_dump_for_frontend())
+        error_index = dmesg_monitor.get_error_index() if dmesg_monitor else {}
+        device_errors = errors_for_port(error_index, port_path)
+        if device.errors != device_errors:
+            device.errors = device_errors
+            device.invalidate_cache()
+        return Response(content=orjson.dumps(device.model_dump_for_frontend()), media_type="application/json")
     raise HTTPException(status_code=404, detail="Device not found")
 
 
@@ -303,7 +344,6 @@ async def set_device_name(request: Request):
         raise HTTPException(status_code=400, detail="Missing required fields")
 
     config_manager.set_device_name(vendor_id, product_id, name)  # type: ignore
-    usb_monitor.config_lookup = config_manager.get_device_lookup()  # type: ignore
 
     return JSONResponse({"success": True})
 
@@ -312,7 +352,7 @@ async def set_device_name(request: Request):
 async def get_errors():
     """Get recent USB errors."""
     errors = get_recent_usb_errors(100)
-    return JSONResponse([
+    content = orjson.dumps([
         {
             "timestamp": e.timestamp,
             "port_path": e.port_path,
@@ -321,6 +361,7 @@ async def get_errors():
         }
         for e in errors
     ])
+    return Response(content=content, media_type="application/json")
 
 
 @app.get("/api/hub-labels")
@@ -328,7 +369,11 @@ async def get_hub_labels():
     """Get custom hub labels configuration."""
     if config_manager is None:
         return JSONResponse({})
-    return JSONResponse(config_manager.get_hub_labels())
+    # orjson can't serialize the read-only view directly
+    return Response(
+        content=orjson.dumps(config_manager.get_hub_labels(), default=dict),
+        media_type="application/json",
+    )
 
 
 @app.post("/api/hub-labels")
@@ -361,7 +406,12 @@ async def health_check():
 async def shutdown():
     """Shutdown the server."""
     logger.info("Shutdown requested via API")
-    os.kill(os.getpid(), signal.SIGTERM)
+    if _server is not None:
+        # Same flag uvicorn's signal handler sets; the response still goes out
+        # before the graceful shutdown completes
+        _server.should_exit = True
+    else:
+        os.kill(os.getpid(), signal.SIGTERM)
     return JSONResponse({"status": "shutting_down"})
 
 
@@ -519,16 +569,18 @@ async def get_testable_hubs():
 
 
 @app.post("/api/learning/test-hub/{port_path:path}")
-async def test_hub(port_path: str):
+async def test_hub(port_path: str, expected_size: Optional[int] = None):
     """Test a hub by temporarily disabling it to detect physical grouping.
 
     This will briefly disconnect the hub and all devices under it,
-    then re-enable it. Requires root privileges.
+    then re-enable it. Requires root privileges. If the number of hubs in
+    the physical device is known, pass it as expected_size to stop probing
+    once that many are found.
     """
     if usb_monitor is None:
         raise HTTPException(status_code=500, detail="USB monitor not initialized")
 
-    result = await usb_monitor.test_hub(port_path)
+    result = await usb_monitor.test_hub(port_path, expected_size)
 
     if result.get("status") == "error":
         raise HTTPException(status_code=400, detail=result.get("message", "Unknown error"))
@@ -538,6 +590,7 @@ async def test_hub(port_path: str):
 
 def run_server(host: str = "0.0.0.0", port: int = 8080, open_browser: bool = True):
     """Run the server."""
+    global _server
     import uvicorn
 
     if open_browser:
@@ -551,7 +604,8 @@ def run_server(host: str = "0.0.0.0", port: int = 8080, open_browser: bool = Tru
         import threading
         threading.Thread(target=open_browser_delayed, daemon=True).start()
 
-    uvicorn.run(app, host=host, port=port, log_level="info")
+    _server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="info"))
+    _server.run()
 
 
 if __name__ == "__main__":
@@ -1,15 +1,22 @@
 """
-Pydantic models for USB devices and events.
+Data models for USB devices, events and configuration.
 
 Defines the data structures used throughout the application for representing
-USB devices, their hierarchy, and real-time events.
+USB devices, their hierarchy, and real-time events. Devices and events are
+plain dataclasses; configuration loaded from disk uses Pydantic models.
 """
 
 from __future__ import annotations
-from typing import Optional
+import sys
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Callable, Optional
+import orjson
 from pydantic import BaseModel, Field
 from enum import Enum
 
+from .vendor_lookup import get_usb_id_database
+
 
 class DeviceClass(str, Enum):
     """USB device class categories for icon and colour mapping."""
@@ -26,58 +33,140 @@ class DeviceClass(str, Enum):
     UNKNOWN = "unknown"
 
 
-class USBDevice(BaseModel):
-    """Represents a USB device in the tree."""
+# Friendly device type names, keyed by DeviceClass value
+_TYPE_NAMES: dict[str, Optional[str]] = {
+    DeviceClass.HUB.value: "Hub",
+    DeviceClass.HID_KEYBOARD.value: "Keyboard",
+    DeviceClass.HID_MOUSE.value: "Mouse",
+    DeviceClass.HID_OTHER.value: "Input Device",
+    DeviceClass.AUDIO.value: "Audio",
+    DeviceClass.VIDEO.value: "Webcam",
+    DeviceClass.STORAGE.value: "Storage",
+    DeviceClass.PRINTER.value: "Printer",
+    DeviceClass.WIRELESS.value: "Wireless",
+    DeviceClass.COMM.value: "Serial",
+    DeviceClass.UNKNOWN.value: None,
+}
+
+def device_key(vendor_id: str, product_id: str) -> str:
+    """Configuration key for a device model, "vendor_id:product_id".
+
+    Interned, so the few distinct keys are shared and compare by identity.
+    """
+    return sys.intern(f"{vendor_id}:{product_id}")
+
+
+# Slotted dataclasses where the running Python supports them (3.10+)
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class USBDevice:
+    """Represents a USB device in the tree.
+
+    A plain dataclass rather than a Pydantic model: devices are built by our
+    own code on every scan and udev event, so per-field validation is pure
+    overhead here. The serialized form is cached, so code that reassigns a
+    field after construction must call invalidate_cache() (or use
+    set_custom_name(), which also refreshes the display name).
+    """
 
     # Identification
-    bus: int = Field(description="USB bus number")
-    device: int = Field(description="Device number on the bus")
-    port_path: str = Field(description="Port path e.g. '5-1.2.4'")
+    bus: int  # USB bus number
+    device: int  # Device number on the bus
+    port_path: str  # Port path e.g. '5-1.2.4'
 
     # USB IDs
-    vendor_id: str = Field(description="Vendor ID in hex e.g. '05e3'")
-    product_id: str = Field(description="Product ID in hex e.g. '0610'")
-
-    # Vendor/Product names from usb.ids database
-    vendor_name: Optional[str] = Field(default=None, description="Vendor name from usb.ids")
-    product_name: Optional[str] = Field(default=None, description="Product name from usb.ids")
+    vendor_id: str  # Vendor ID in hex e.g. '05e3'
+    product_id: str  # Product ID in hex e.g. '0610'
 
     # Descriptors
-    manufacturer: Optional[str] = Field(default=None, description="Manufacturer string")
-    product: Optional[str] = Field(default=None, description="Product string")
-    serial: Optional[str] = Field(default=None, description="Serial number")
+    manufacturer: Optional[str] = None  # Manufacturer string
+    product: Optional[str] = None  # Product string
+    serial: Optional[str] = None  # Serial number
 
     # Technical details
-    speed: str = Field(description="Connection speed e.g. '480M', '5000M'")
-    usb_version: str = Field(default="", description="USB version e.g. '2.0', '3.1'")
-    device_class: DeviceClass = Field(default=DeviceClass.UNKNOWN)
-    device_class_raw: int = Field(default=0, description="Raw USB device class code")
+    speed: str = ""  # Connection speed e.g. '480M', '5000M'
+    usb_version: str = ""  # USB version e.g. '2.0', '3.1'
+    device_class: DeviceClass = DeviceClass.UNKNOWN
+    device_class_raw: int = 0  # Raw USB device class code
 
     # Hub specific
-    num_ports: Optional[int] = Field(default=None, description="Number of ports if hub")
+    num_ports: Optional[int] = None  # Number of ports if hub
 
     # Power
-    power_draw_ma: int = Field(default=0, description="Power draw in milliamps")
+    power_draw_ma: int = 0  # Power draw in milliamps
 
     # User customisation
-    custom_name: Optional[str] = Field(default=None, description="User-defined name")
+    custom_name: Optional[str] = None  # User-defined name
 
     # Errors
-    errors: list[str] = Field(default_factory=list, description="Error messages from dmesg")
-    has_errors: bool = Field(default=False, description="Quick check for error state")
+    errors: list[str] = field(default_factory=list)  # Error messages from dmesg, deduplicated
 
     # Hierarchy
-    children: list[USBDevice] = Field(default_factory=list, description="Child devices")
-    parent_path: Optional[str] = Field(default=None, description="Parent device path")
+    children: list[USBDevice] = field(default_factory=list)  # Child devices
+    parent_path: Optional[str] = None  # Parent device path
 
     # State
-    is_root_hub: bool = Field(default=False, description="True if this is a root hub")
-    driver: Optional[str] = Field(default=None, description="Kernel driver name")
-    dev_nodes: list[str] = Field(default_factory=list, description="Device nodes like /dev/ttyACM0")
+    is_root_hub: bool = False  # True if this is a root hub
+    driver: Optional[str] = None  # Kernel driver name
+    dev_nodes: list[str] = field(default_factory=list)  # Device nodes like /dev/ttyACM0
+
+    # Unique identifier for this device instance, "<bus>-<port_path>"
+    unique_id: str = field(init=False, default="")
+    # Key into the device-name configuration, "vendor_id:product_id"
+    config_key: str = field(init=False, default="", repr=False, compare=False)
+
+    # Serialized fields (excluding children); see invalidate_cache()
+    _frontend_cache: Optional[dict] = field(default=None, init=False, repr=False, compare=False)
+    # Only the custom name changes after construction; see set_custom_name()
+    _display_name_cache: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    # (vendor_name, product_name) from the usb.ids database, looked up on first use
+    _usb_id_names: Optional[tuple[Optional[str], Optional[str]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        self.unique_id = f"{self.bus}-{self.port_path}"
+        self.config_key = device_key(self.vendor_id, self.product_id)
+
+    def invalidate_cache(self) -> None:
+        """Drop the cached serialization after a field has been reassigned."""
+        self._frontend_cache = None
+
+    def set_custom_name(self, name: Optional[str]) -> None:
+        """Set the user-defined name, refreshing the display name."""
+        self.custom_name = name
+        self._display_name_cache = None
+        self._frontend_cache = None
+
+    @property
+    def vendor_name(self) -> Optional[str]:
+        """Vendor name from usb.ids."""
+        return self._lookup_usb_id_names()[0]
+
+    @property
+    def product_name(self) -> Optional[str]:
+        """Product name from usb.ids."""
+        return self._lookup_usb_id_names()[1]
+
+    def _lookup_usb_id_names(self) -> tuple[Optional[str], Optional[str]]:
+        # Resolved lazily so the usb.ids database is only loaded once a name
+        # is actually needed
+        names = self._usb_id_names
+        if names is None:
+            names = self._usb_id_names = get_usb_id_database().lookup(self.vendor_id, self.product_id)
+        return names
 
     @property
     def display_name(self) -> str:
         """Get the best available name for display."""
+        name = self._display_name_cache
+        if name is None:
+            name = self._display_name_cache = self._compute_display_name()
+        return name
+
+    def _compute_display_name(self) -> str:
         if self.custom_name:
             return self.custom_name
         if self.product:
@@ -101,35 +190,66 @@ class USBDevice(BaseModel):
 
     def _friendly_device_type(self) -> Optional[str]:
         """Get friendly name for device type."""
-        type_names = {
-            DeviceClass.HUB: "Hub",
-            DeviceClass.HID_KEYBOARD: "Keyboard",
-            DeviceClass.HID_MOUSE: "Mouse",
-            DeviceClass.HID_OTHER: "Input Device",
-            DeviceClass.AUDIO: "Audio",
-            DeviceClass.VIDEO: "Webcam",
-            DeviceClass.STORAGE: "Storage",
-            DeviceClass.PRINTER: "Printer",
-            DeviceClass.WIRELESS: "Wireless",
-            DeviceClass.COMM: "Serial",
-            DeviceClass.UNKNOWN: None,
-        }
-        return type_names.get(self.device_class)
+        return _TYPE_NAMES.get(self.device_class.value)
 
     @property
-    def unique_id(self) -> str:
-        """Unique identifier for this device instance."""
-        return f"{self.bus}-{self.port_path}"
+    def has_errors(self) -> bool:
+        """Quick check for error state."""
+        return bool(self.errors)
+
+    def _frontend_fields(self) -> dict:
+        """Serialized own fields, cached until one of them is reassigned."""
+        own = self._frontend_cache
+        if own is None:
+            # Children are left out; model_dump_for_frontend adds them
+            own = {
+                "bus": self.bus,
+                "device": self.device,
+                "port_path": self.port_path,
+                "vendor_id": self.vendor_id,
+                "product_id": self.product_id,
+                "vendor_name": self.vendor_name,
+                "product_name": self.product_name,
+                "manufacturer": self.manufacturer,
+                "product": self.product,
+                "serial": self.serial,
+                "speed": self.speed,
+                "usb_version": self.usb_version,
+                "device_class": self.device_class,
+                "device_class_raw": self.device_class_raw,
+                "num_ports": self.num_ports,
+                "power_draw_ma": self.power_draw_ma,
+                "custom_name": self.custom_name,
+                "errors": list(self.errors),
+                "parent_path": self.parent_path,
+                "is_root_hub": self.is_root_hub,
+                "driver": self.driver,
+                "dev_nodes": list(self.dev_nodes),
+                "unique_id": self.unique_id,
+                "display_name": self.display_name,
+            }
+            if self.errors:
+                # Omitted when false to keep full trees small
+                own["has_errors"] = True
+            self._frontend_cache = own
+        return own
 
     def model_dump_for_frontend(self) -> dict:
-        """Serialize for frontend consumption with computed properties."""
-        data = self.model_dump()
-        data["display_name"] = self.display_name
-        data["unique_id"] = self.unique_id
-
-        # Recursively serialize children
-        if self.children:
-            data["children"] = [child.model_dump_for_frontend() for child in self.children]
+        """Serialize for frontend consumption with computed properties.
+
+        The device's own fields are serialized once and reused until one of
+        them is reassigned; the children lists are rebuilt on every call.
+        The subtree is walked with an explicit stack rather than recursion.
+        """
+        data = dict(self._frontend_fields())
+        stack = [(self, data)]
+        while stack:
+            device, out = stack.pop()
+            children = out["children"] = []
+            for child in device.children:
+                child_data = dict(child._frontend_fields())
+                children.append(child_data)
+                stack.append((child, child_data))
 
         return data
 
@@ -148,7 +268,8 @@ class EventType(str, Enum):
     LEARNING_CANCELLED = "learning_cancelled"
 
 
-class USBEvent(BaseModel):
+@dataclass(**_DATACLASS_OPTIONS)
+class USBEvent:
     """Represents a USB event to be sent to the frontend."""
 
     type: EventType
@@ -156,27 +277,15 @@ class USBEvent(BaseModel):
     devices: Optional[list[USBDevice]] = None  # For full_tree
     port_path: Optional[str] = None  # For removals (device no longer exists)
     error_message: Optional[str] = None
-    timestamp: float = Field(default=0.0)
+    timestamp: float = 0.0
     # Learning mode data
-    learning_data: Optional[dict] = Field(default=None, description="Data for learning mode events")
+    learning_data: Optional[dict] = None
 
     def to_websocket_message(self) -> dict:
         """Convert to WebSocket message format."""
         msg = {"type": self.type.value, "timestamp": self.timestamp}
 
-        if self.type == EventType.FULL_TREE:
-            msg["data"] = [d.model_dump_for_frontend() for d in (self.devices or [])]
-        elif self.type == EventType.DEVICE_REMOVED:
-            msg["port_path"] = self.port_path
-            # Include device data so frontend can show info about removed device
-            if self.device:
-                msg["data"] = self.device.model_dump_for_frontend()
-        elif self.type == EventType.DEVICE_ERROR:
-            msg["port_path"] = self.port_path
-            if self.device:
-                msg["data"] = self.device.model_dump_for_frontend()
-        elif self.device:
-            msg["data"] = self.device.model_dump_for_frontend()
+        _MESSAGE_BODIES.get(self.type, _add_device_data)(self, msg)
 
         if self.error_message:
             msg["error"] = self.error_message
@@ -186,6 +295,33 @@ class USBEvent(BaseModel):
 
         return msg
 
+    def to_websocket_json(self) -> str:
+        """Convert to a serialized WebSocket message (JSON text)."""
+        return orjson.dumps(self.to_websocket_message()).decode()
+
+
+def _add_device_data(event: USBEvent, msg: dict) -> None:
+    if event.device:
+        msg["data"] = event.device.model_dump_for_frontend()
+
+
+def _add_tree_data(event: USBEvent, msg: dict) -> None:
+    msg["data"] = [d.model_dump_for_frontend() for d in (event.devices or [])]
+
+
+def _add_port_and_device_data(event: USBEvent, msg: dict) -> None:
+    msg["port_path"] = event.port_path
+    # Include device data so frontend can show info about removed device
+    _add_device_data(event, msg)
+
+
+# Per-type message body builders; other event types just carry the device
+_MESSAGE_BODIES: dict[EventType, Callable[[USBEvent, dict], None]] = {
+    EventType.FULL_TREE: _add_tree_data,
+    EventType.DEVICE_REMOVED: _add_port_and_device_data,
+    EventType.DEVICE_ERROR: _add_port_and_device_data,
+}
+
 
 class DeviceConfig(BaseModel):
     """User configuration for a device (custom name, etc)."""
@@ -195,6 +331,11 @@ class DeviceConfig(BaseModel):
     custom_name: Optional[str] = None
     notes: Optional[str] = None
 
+    @cached_property
+    def key(self) -> str:
+        """Configuration key, "vendor_id:product_id"."""
+        return device_key(self.vendor_id, self.product_id)
+
 
 class PhysicalGroup(BaseModel):
     """A group of devices that are part of the same physical device."""
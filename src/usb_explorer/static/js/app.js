@@ -236,6 +236,10 @@ class App {
                 this.handleDeviceAdded(data.data);
                 break;
 
+            case 'device_updated':
+                this.handleDeviceUpdated(data.data);
+                break;
+
             case 'device_removed':
                 this.handleDeviceRemoved(data.port_path, data.data);
                 break;
@@ -284,6 +288,19 @@ class App {
         });
     }
 
+    handleDeviceUpdated(device) {
+        console.log('Device updated:', device.display_name);
+
+        // Update tree in place; nothing was plugged, so no sound or log entry
+        const updated = window.usbTree.updateDevice(device);
+
+        // Update info panel if showing this device
+        if (window.infoPanel.currentDevice &&
+            window.infoPanel.currentDevice.port_path === device.port_path) {
+            window.infoPanel.showDevice(updated);
+        }
+    }
+
     handleDeviceRemoved(portPath, device) {
         const name = device ? device.display_name : portPath;
         console.log('Device removed:', name);
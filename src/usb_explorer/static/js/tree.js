@@ -235,6 +235,20 @@ class USBTree {
         this.render();
     }
 
+    updateDevice(device) {
+        const existing = this.findDevice(device.port_path);
+        if (!existing) {
+            this.addDevice(device);
+            return device;
+        }
+
+        // Keep the subtree and error history already shown for this device
+        const { children, errors, has_errors, ...fields } = device;
+        Object.assign(existing, fields);
+        this.render();
+        return existing;
+    }
+
     removeDevice(portPath) {
         // Mark as removing
         this.removingNodes.add(portPath);
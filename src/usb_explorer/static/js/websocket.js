@@ -44,7 +44,11 @@ class USBWebSocket {
         this.socket.onmessage = (event) => {
             try {
                 const data = JSON.parse(event.data);
-                this.callbacks.onMessage.forEach(cb => cb(data));
+                // Bursts of events arrive wrapped in a single batch message
+                const messages = data.type === 'batch' ? data.events : [data];
+                messages.forEach(msg => {
+                    this.callbacks.onMessage.forEach(cb => cb(msg));
+                });
             } catch (e) {
                 console.error('Failed to parse WebSocket message:', e);
             }
@@ -7,55 +7,190 @@ and builds a hierarchical tree representation of the USB topology.
 
 from __future__ import annotations
 import asyncio
+import bisect
+import functools
 import logging
-from pathlib import Path
-from typing import Callable, Optional
+import operator
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Mapping, Optional
 import pyudev
 
-from .models import USBDevice, DeviceClass, USBEvent, EventType
-from .vendor_lookup import get_usb_id_database
+from .models import USBDevice, DeviceClass, USBEvent, EventType, device_key
 
 logger = logging.getLogger(__name__)
 
+# sysfs path components naming a USB device: root hubs ("usb5") and port
+# paths ("5-1.2.4"). Interfaces ("5-1.2:1.0") don't match.
+_PORT_PATH_RE = re.compile(r"/(usb\d+|\d+-[\d.]+)(?=/|$)")
+_PORT_NAME_RE = re.compile(r"usb\d+|\d+-[\d.]+")
+# Bus and port numbers of a port path: "usb5" -> ("5", None), "5-1.2" -> ("5", "1.2")
+_PORT_TOKENS_RE = re.compile(r"(?:usb)?(\d+)(?:-(\d+(?:\.\d+)*))?")
+# The deepest USB interface ("5-1.2:1.0") a sysfs path lies under
+_INTERFACE_ANCESTOR_RE = re.compile(r"(.*/\d+-[\d.]+:\d+\.\d+)/")
+# Name of a USB interface's sysfs directory, e.g. "5-1.2:1.0"
+_INTERFACE_NAME_RE = re.compile(r"\d+-[\d.]+:\d+\.\d+")
+
+# Every USB device and interface has an entry here, named as above
+SYSFS_USB_DEVICES = "/sys/bus/usb/devices"
+
+# Worker threads used to build devices during a full scan
+SCAN_WORKERS = 8
+
+# Netlink receive buffer for udev events, large enough that a burst of
+# enumerations (e.g. plugging in a dock) isn't dropped by the kernel
+MONITOR_RECEIVE_BUFFER = 1 << 20
+
+# udev actions after which a known device is rebuilt: its own driver binding
+# or attribute changes, and drivers binding to or unbinding from its
+# interfaces (which set its driver, class and device nodes)
+_DEVICE_UPDATE_ACTIONS = frozenset(("bind", "change"))
+_INTERFACE_UPDATE_ACTIONS = frozenset(("bind", "unbind"))
+
+# libudev contexts must not be shared between threads, so scan workers each
+# get their own
+_thread_local = threading.local()
+
+
+def _thread_context() -> pyudev.Context:
+    """Get the calling thread's pyudev context."""
+    context = getattr(_thread_local, "context", None)
+    if context is None:
+        context = _thread_local.context = pyudev.Context()
+    return context
+
+
+# Kernel drivers that identify the device type outright, for interfaces and
+# devices alike. HID drivers are handled separately to tell keyboards from mice.
+_TYPE_DRIVER_CLASSES: dict[str, DeviceClass] = {
+    "snd-usb-audio": DeviceClass.AUDIO,
+    "snd_usb_audio": DeviceClass.AUDIO,
+    "uvcvideo": DeviceClass.VIDEO,
+    "uvc": DeviceClass.VIDEO,
+    "usb-storage": DeviceClass.STORAGE,
+    "uas": DeviceClass.STORAGE,
+    "usblp": DeviceClass.PRINTER,
+    "btusb": DeviceClass.WIRELESS,
+    "ath3k": DeviceClass.WIRELESS,
+    "rtl8xxxu": DeviceClass.WIRELESS,
+    "cdc_acm": DeviceClass.COMM,
+    "cdc_ether": DeviceClass.COMM,
+    "ch341": DeviceClass.COMM,
+    "cp210x": DeviceClass.COMM,
+    "ftdi_sio": DeviceClass.COMM,
+    "pl2303": DeviceClass.COMM,
+}
+_DRIVER_CLASSES: dict[str, DeviceClass] = {"hub": DeviceClass.HUB, **_TYPE_DRIVER_CLASSES}
+
+_HID_DRIVERS = frozenset(("usbhid", "hid-generic"))
+
+# Interface drivers; HID ones map to HID_OTHER, refined by looking at the
+# interface's input devices
+_INTERFACE_DRIVER_CLASSES: dict[str, DeviceClass] = {
+    **_TYPE_DRIVER_CLASSES,
+    **dict.fromkeys(("usbhid", "hid-generic", "hid"), DeviceClass.HID_OTHER),
+}
+
+# USB class codes (bInterfaceClass / bDeviceClass) we map to a device type
+_INTERFACE_CLASS_CODES: dict[int, DeviceClass] = {
+    1: DeviceClass.AUDIO,  # Audio
+    2: DeviceClass.COMM,  # Communications
+    3: DeviceClass.HID_OTHER,  # HID
+    7: DeviceClass.PRINTER,  # Printer
+    8: DeviceClass.STORAGE,  # Mass Storage
+    14: DeviceClass.VIDEO,  # Video
+    224: DeviceClass.WIRELESS,  # Wireless
+}
+_DEVICE_CLASS_CODES: dict[int, DeviceClass] = {9: DeviceClass.HUB, **_INTERFACE_CLASS_CODES}
+
+
+def _event_build_path(device: pyudev.Device) -> Optional[str]:
+    """Sysfs path of the USB device to (re)build for a udev event, if any."""
+    action = device.action
+    devtype = device.get("DEVTYPE")
+    if devtype == "usb_device":
+        if action == "add" or action in _DEVICE_UPDATE_ACTIONS:
+            return device.sys_path
+    elif devtype == "usb_interface" and action in _INTERFACE_UPDATE_ACTIONS:
+        # Interfaces sit directly under their device in sysfs
+        return os.path.dirname(device.sys_path)
+    return None
+
+
+def _port_path_from_sys_path(sys_path: str) -> Optional[str]:
+    """Extract the port path from a sysfs path: its deepest "usb1" / "5-1.2.4" component."""
+    matches = _PORT_PATH_RE.findall(sys_path)
+    return matches[-1] if matches else None
+
+
+@functools.lru_cache(maxsize=512)
+def _port_sort_key(port_path: str) -> tuple[int, ...]:
+    """Bus then port numbers of a port path, e.g. "5-1.2.4" -> (5, 1, 2, 4).
+
+    Orders devices as the tree lists them; paths that don't parse sort first.
+    """
+    match = _PORT_TOKENS_RE.fullmatch(port_path)
+    if match is None:
+        return ()
+    bus, ports = match.groups()
+    return (int(bus), *map(int, ports.split("."))) if ports else (int(bus),)
+
+
+@functools.lru_cache(maxsize=512)
+def _parent_port_path(port_path: str) -> Optional[str]:
+    """Port path of a device's parent, memoized since ports recur across scans.
+
+    e.g., "5-1.2.4" -> parent is "5-1.2"
+    e.g., "5-1" -> parent is "usb5"
+    """
+    head, dot, _ = port_path.rpartition(".")
+    if dot:
+        return sys.intern(head)
+    bus, dash, _ = port_path.partition("-")
+    if dash:
+        return sys.intern(f"usb{bus}")
+    return None
+
+
+def _parse_class_code(value: object) -> Optional[int]:
+    """Parse a hex USB class code as found in udev properties / sysfs."""
+    try:
+        return int(value, 16) if isinstance(value, str) else int(value)  # type: ignore[call-overload]
+    except (ValueError, TypeError):
+        return None
 
-def get_device_class(device: pyudev.Device) -> DeviceClass:
-    """Determine device class from udev properties."""
-    context = device.context
 
-    # Check driver first for quick classification
-    driver = device.get("DRIVER", "")
+def _hid_interface_class(context: pyudev.Context, interface: pyudev.Device) -> DeviceClass:
+    """Tell keyboards from mice by the input devices under a HID interface."""
+    for input_dev in context.list_devices(subsystem="input", parent=interface):
+        if input_dev.get("ID_INPUT_KEYBOARD"):
+            return DeviceClass.HID_KEYBOARD
+        if input_dev.get("ID_INPUT_MOUSE"):
+            return DeviceClass.HID_MOUSE
+    return DeviceClass.HID_OTHER
+
 
-    if driver == "hub":
-        return DeviceClass.HUB
+@functools.lru_cache(maxsize=512)
+def _classify_properties(
+    driver: str, is_keyboard: bool, is_mouse: bool, id_type: str, is_input: bool
+) -> Optional[DeviceClass]:
+    """Classify from udev properties alone, or None if they don't decide it.
 
-    if driver in ("usbhid", "hid-generic"):
+    Memoized: most devices on a machine share one of a few property sets.
+    """
+    if driver in _HID_DRIVERS:
         # Try to distinguish keyboard vs mouse
-        if device.get("ID_INPUT_KEYBOARD"):
+        if is_keyboard:
             return DeviceClass.HID_KEYBOARD
-        if device.get("ID_INPUT_MOUSE"):
+        if is_mouse:
             return DeviceClass.HID_MOUSE
         return DeviceClass.HID_OTHER
 
-    if driver in ("snd-usb-audio", "snd_usb_audio"):
-        return DeviceClass.AUDIO
-
-    if driver in ("uvcvideo", "uvc"):
-        return DeviceClass.VIDEO
-
-    if driver in ("usb-storage", "uas"):
-        return DeviceClass.STORAGE
-
-    if driver in ("usblp",):
-        return DeviceClass.PRINTER
-
-    if driver in ("btusb", "ath3k", "rtl8xxxu"):
-        return DeviceClass.WIRELESS
-
-    if driver in ("cdc_acm", "cdc_ether", "ch341", "cp210x", "ftdi_sio", "pl2303"):
-        return DeviceClass.COMM
-
     # Check ID_TYPE which udev sets based on detected type
-    id_type = device.get("ID_TYPE", "")
     if id_type == "video":
         return DeviceClass.VIDEO
     if id_type == "audio":
@@ -64,113 +199,165 @@ def get_device_class(device: pyudev.Device) -> DeviceClass:
         return DeviceClass.STORAGE
 
     # Check ID_INPUT properties (set for HID devices)
-    if device.get("ID_INPUT_KEYBOARD"):
+    if is_keyboard:
         return DeviceClass.HID_KEYBOARD
-    if device.get("ID_INPUT_MOUSE"):
+    if is_mouse:
         return DeviceClass.HID_MOUSE
-    if device.get("ID_INPUT"):
+    if is_input:
         return DeviceClass.HID_OTHER
 
-    # Check device class from USB descriptor - read from sysfs if not in udev
-    bDeviceClass = device.get("bDeviceClass")
-    if not bDeviceClass:
-        # Try reading directly from sysfs
-        try:
-            class_path = Path(device.sys_path) / "bDeviceClass"
-            if class_path.exists():
-                bDeviceClass = class_path.read_text().strip()
-        except Exception:
-            pass
+    return None
 
-    if bDeviceClass:
-        try:
-            class_code = int(bDeviceClass, 16) if isinstance(bDeviceClass, str) else int(bDeviceClass)
-            if class_code == 9:  # Hub
-                return DeviceClass.HUB
-            if class_code == 1:  # Audio
-                return DeviceClass.AUDIO
-            if class_code == 2:  # Communications
-                return DeviceClass.COMM
-            if class_code == 3:  # HID
-                return DeviceClass.HID_OTHER
-            if class_code == 7:  # Printer
-                return DeviceClass.PRINTER
-            if class_code == 8:  # Mass Storage
-                return DeviceClass.STORAGE
-            if class_code == 14:  # Video
-                return DeviceClass.VIDEO
-            if class_code == 224:  # Wireless
-                return DeviceClass.WIRELESS
-        except (ValueError, TypeError):
-            pass
 
-    # Look at child interfaces for classification (USB devices with class 0x00)
-    # Interfaces have the actual class info
-    try:
-        for child in context.list_devices(
-            subsystem="usb",
-            DEVTYPE="usb_interface",
-            parent=device
-        ):
-            child_driver = child.get("DRIVER", "")
+class InterfaceIndex:
+    """USB interfaces and the HID input types below them, from one enumeration.
 
-            # Check driver on interfaces
-            if child_driver in ("usbhid", "hid-generic", "hid"):
-                # Look deeper for input type
-                for input_dev in context.list_devices(subsystem="input", parent=child):
-                    if input_dev.get("ID_INPUT_KEYBOARD"):
-                        return DeviceClass.HID_KEYBOARD
-                    if input_dev.get("ID_INPUT_MOUSE"):
-                        return DeviceClass.HID_MOUSE
-                return DeviceClass.HID_OTHER
+    Built once per full scan so classifying each device doesn't start its
+    own libudev enumerations of interfaces and input devices. Holds plain
+    data only, so it can be shared with the scan worker threads.
+    """
+
+    def __init__(self, context: pyudev.Context):
+        # Device sys_path -> [(interface sys_path, DRIVER, bInterfaceClass)]
+        self.by_parent: dict[str, list[tuple[str, str, Optional[str]]]] = {}
+        # HID interface sys_path -> keyboard/mouse, from its input devices
+        self.hid_classes: dict[str, DeviceClass] = {}
+
+        for iface in context.list_devices(subsystem="usb", DEVTYPE="usb_interface"):
+            sys_path = iface.sys_path
+            self.by_parent.setdefault(os.path.dirname(sys_path), []).append(
+                (sys_path, iface.get("DRIVER", ""), iface.get("bInterfaceClass"))
+            )
 
-            if child_driver in ("snd-usb-audio", "snd_usb_audio"):
-                return DeviceClass.AUDIO
+        for input_dev in context.list_devices(subsystem="input"):
+            match = _INTERFACE_ANCESTOR_RE.match(input_dev.sys_path)
+            if not match or match.group(1) in self.hid_classes:
+                continue
+            if input_dev.get("ID_INPUT_KEYBOARD"):
+                self.hid_classes[match.group(1)] = DeviceClass.HID_KEYBOARD
+            elif input_dev.get("ID_INPUT_MOUSE"):
+                self.hid_classes[match.group(1)] = DeviceClass.HID_MOUSE
+
+
+def _iter_interfaces(device: pyudev.Device) -> Iterator[pyudev.Device]:
+    """Yield a USB device's interfaces, in sysfs path order.
+
+    Interfaces are always direct subdirectories of their device, so listing
+    that one directory avoids a udev enumeration, which would load every
+    descendant (endpoints, input devices, ...) only to match DEVTYPE.
+    """
+    with os.scandir(device.sys_path) as entries:
+        paths = sorted(entry.path for entry in entries if _INTERFACE_NAME_RE.fullmatch(entry.name))
+    for path in paths:
+        try:
+            yield pyudev.Devices.from_sys_path(device.context, path)
+        except pyudev.DeviceNotFoundError:
+            continue  # Went away while listing
+
+
+def get_device_class(
+    device: pyudev.Device,
+    class_code: Optional[int] = None,
+    driver: Optional[str] = None,
+    interfaces: Optional[InterfaceIndex] = None,
+) -> DeviceClass:
+    """Determine device class from udev properties.
+
+    Args:
+        device: The udev USB device
+        class_code: Already parsed bDeviceClass, if the caller has it; otherwise
+            it is read from udev or sysfs as needed
+        driver: The DRIVER property, if the caller has already read it
+        interfaces: Interface index from a full scan; without it the device's
+            interfaces are enumerated through udev
+    """
+    # Check driver first for quick classification
+    if driver is None:
+        driver = device.get("DRIVER", "")
+
+    driver_class = _DRIVER_CLASSES.get(driver)
+    if driver_class is not None:
+        return driver_class
+
+    property_class = _classify_properties(
+        driver,
+        bool(device.get("ID_INPUT_KEYBOARD")),
+        bool(device.get("ID_INPUT_MOUSE")),
+        device.get("ID_TYPE", ""),
+        bool(device.get("ID_INPUT")),
+    )
+    if property_class is not None:
+        return property_class
 
-            if child_driver in ("uvcvideo", "uvc"):
-                return DeviceClass.VIDEO
+    # Check device class from USB descriptor - read from sysfs if not in udev
+    if class_code is None:
+        bDeviceClass = device.get("bDeviceClass")
+        if not bDeviceClass:
+            # Try reading directly from sysfs
+            bDeviceClass = _read_sysfs_attr(os.path.join(device.sys_path, "bDeviceClass"))
 
-            if child_driver in ("usb-storage", "uas"):
-                return DeviceClass.STORAGE
+        if bDeviceClass:
+            class_code = _parse_class_code(bDeviceClass)
 
-            if child_driver in ("usblp",):
-                return DeviceClass.PRINTER
+    if class_code is not None:
+        code_class = _DEVICE_CLASS_CODES.get(class_code)
+        if code_class is not None:
+            return code_class
 
-            if child_driver in ("btusb", "ath3k", "rtl8xxxu"):
-                return DeviceClass.WIRELESS
+    # Look at child interfaces for classification (USB devices with class 0x00)
+    # Interfaces have the actual class info
+    if interfaces is not None:
+        for iface_path, iface_driver, bInterfaceClass in interfaces.by_parent.get(device.sys_path, ()):
+            driver_class = _INTERFACE_DRIVER_CLASSES.get(iface_driver)
+            if driver_class is DeviceClass.HID_OTHER:
+                return interfaces.hid_classes.get(iface_path, DeviceClass.HID_OTHER)
+            if driver_class is not None:
+                return driver_class
+            if bInterfaceClass:
+                code_class = _INTERFACE_CLASS_CODES.get(_parse_class_code(bInterfaceClass))  # type: ignore[arg-type]
+                if code_class is not None:
+                    return code_class
+        return DeviceClass.UNKNOWN
 
-            if child_driver in ("cdc_acm", "cdc_ether", "ch341", "cp210x", "ftdi_sio", "pl2303"):
-                return DeviceClass.COMM
+    context = device.context
+    try:
+        for child in _iter_interfaces(device):
+            # Check driver on interfaces
+            driver_class = _INTERFACE_DRIVER_CLASSES.get(child.get("DRIVER", ""))
+            if driver_class is DeviceClass.HID_OTHER:
+                return _hid_interface_class(context, child)
+            if driver_class is not None:
+                return driver_class
 
             # Check interface class
             bInterfaceClass = child.get("bInterfaceClass")
             if bInterfaceClass:
-                try:
-                    iface_class = int(bInterfaceClass, 16) if isinstance(bInterfaceClass, str) else int(bInterfaceClass)
-                    if iface_class == 1:  # Audio
-                        return DeviceClass.AUDIO
-                    if iface_class == 2:  # Communications
-                        return DeviceClass.COMM
-                    if iface_class == 3:  # HID
-                        return DeviceClass.HID_OTHER
-                    if iface_class == 7:  # Printer
-                        return DeviceClass.PRINTER
-                    if iface_class == 8:  # Mass Storage
-                        return DeviceClass.STORAGE
-                    if iface_class == 14:  # Video
-                        return DeviceClass.VIDEO
-                    if iface_class == 224:  # Wireless
-                        return DeviceClass.WIRELESS
-                except (ValueError, TypeError):
-                    pass
+                iface_class = _parse_class_code(bInterfaceClass)
+                code_class = _INTERFACE_CLASS_CODES.get(iface_class)  # type: ignore[arg-type]
+                if code_class is not None:
+                    return code_class
     except Exception as e:
         logger.debug(f"Error checking child interfaces: {e}")
 
     return DeviceClass.UNKNOWN
 
 
+# The legal USB link speeds (Mbit/s, as reported by the kernel)
+_SPEEDS = {
+    "1.5": "1.5M",
+    "12": "12M",
+    "480": "480M",
+    "5000": "5G",
+    "10000": "10G",
+    "20000": "20G",
+}
+
+
 def parse_speed(speed_str: str) -> str:
     """Convert speed value to human-readable format."""
+    speed_name = _SPEEDS.get(speed_str)
+    if speed_name is not None:
+        return speed_name
     if not speed_str:
         return ""
     try:
@@ -183,51 +370,89 @@ def parse_speed(speed_str: str) -> str:
         return ""
 
 
+def _is_testable_hub(device: USBDevice) -> bool:
+    """True for hubs that can be deauthorized, i.e. anything but a root hub."""
+    return device.device_class == DeviceClass.HUB and not device.is_root_hub
+
+
+def _walk_tree(devices: Iterable[USBDevice]) -> Iterator[USBDevice]:
+    """Yield devices and all their descendants, depth first in child order.
+
+    Walks with an explicit stack instead of recursing per node.
+    """
+    stack = list(devices)
+    stack.reverse()
+    while stack:
+        device = stack.pop()
+        yield device
+        stack.extend(reversed(device.children))
+
+
+def _open_authorized(port_path: str) -> int:
+    """Open a USB device's sysfs "authorized" attribute for writing."""
+    return os.open(os.path.join(SYSFS_USB_DEVICES, port_path, "authorized"), os.O_WRONLY)
+
+
+async def _set_authorized(fd: int, value: bytes) -> None:
+    """Write b"0" or b"1" to an open "authorized" attribute.
+
+    Deauthorizing unbinds drivers synchronously in the kernel, so the write
+    runs in a worker thread to keep the event loop responsive.
+    """
+    await asyncio.to_thread(os.pwrite, fd, value, 0)
+
+
+# Subsystems whose device nodes are listed for a USB device: serial ports,
+# storage, sound, webcams, input devices and hidraw
+_NODE_SUBSYSTEMS = frozenset(("tty", "block", "sound", "video4linux", "input", "hidraw"))
+
+
 def find_device_nodes(device: pyudev.Device) -> list[str]:
-    """Find /dev/ nodes associated with a USB device (e.g., /dev/ttyACM0, /dev/sda)."""
+    """Find /dev/ nodes associated with a USB device (e.g., /dev/ttyACM0, /dev/sda).
+
+    The device's descendants are enumerated once and filtered by subsystem
+    here, rather than with one udev enumeration per subsystem.
+    """
     dev_nodes = []
-    context = device.context
 
     try:
-        # Look for tty devices (serial ports like ttyACM0, ttyUSB0)
-        for tty_dev in context.list_devices(subsystem="tty", parent=device):
-            if tty_dev.device_node:
-                dev_nodes.append(tty_dev.device_node)
-
-        # Look for block devices (storage like sda, sdb)
-        for block_dev in context.list_devices(subsystem="block", parent=device):
-            if block_dev.device_node:
-                dev_nodes.append(block_dev.device_node)
-
-        # Look for sound devices
-        for snd_dev in context.list_devices(subsystem="sound", parent=device):
-            if snd_dev.device_node:
-                dev_nodes.append(snd_dev.device_node)
-
-        # Look for video devices (webcams)
-        for video_dev in context.list_devices(subsystem="video4linux", parent=device):
-            if video_dev.device_node:
-                dev_nodes.append(video_dev.device_node)
-
-        # Look for input devices
-        for input_dev in context.list_devices(subsystem="input", parent=device):
-            if input_dev.device_node:
-                dev_nodes.append(input_dev.device_node)
-
-        # Look for hidraw devices
-        for hid_dev in context.list_devices(subsystem="hidraw", parent=device):
-            if hid_dev.device_node:
-                dev_nodes.append(hid_dev.device_node)
-
+        for child in device.context.list_devices(parent=device):
+            if child.subsystem in _NODE_SUBSYSTEMS:
+                device_node = child.device_node
+                if device_node:
+                    dev_nodes.append(device_node)
     except Exception as e:
         logger.debug(f"Error finding device nodes: {e}")
 
-    # Sort and deduplicate
+    # Sort and deduplicate; most devices have at most one node
+    if len(dev_nodes) < 2:
+        return dev_nodes
     return sorted(set(dev_nodes))
 
 
-def build_usb_device(device: pyudev.Device, config_lookup: Optional[dict] = None) -> Optional[USBDevice]:
-    """Build a USBDevice from a pyudev Device."""
+def _read_sysfs_attr(path: str) -> Optional[str]:
+    """Read a sysfs attribute file with one open and read, or None if unreadable."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return os.read(fd, 256).decode("utf-8", "replace").strip()
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def build_usb_device(
+    device: pyudev.Device,
+    config_lookup: Optional[Mapping[str, str]] = None,
+    interfaces: Optional[InterfaceIndex] = None,
+) -> Optional[USBDevice]:
+    """Build a USBDevice from a pyudev Device.
+
+    Pass the scan's InterfaceIndex when building many devices at once.
+    """
     try:
         # Get basic properties
         busnum = device.get("BUSNUM")
@@ -239,55 +464,52 @@ def build_usb_device(device: pyudev.Device, config_lookup: Optional[dict] = None
         # Build port path from device path
         # Device path looks like: /sys/devices/pci0000:00/.../usb5/5-1/5-1.2
         devpath = device.sys_path
-        port_path = ""
 
         # busnum has leading zeros (e.g., "001") but paths use bare numbers ("1-1")
         bus_bare = str(int(busnum))
 
-        # Extract port path from sys_path
-        parts = devpath.split("/")
-        for part in reversed(parts):
-            # Match patterns like "1-1", "5-1.2.4", or "usb1"
-            if part.startswith(bus_bare + "-"):
-                port_path = part
-                break
-            if part == f"usb{bus_bare}":
-                port_path = part
-                break
+        # Root hub fallback
+        port_path = _port_path_from_sys_path(devpath) or f"usb{bus_bare}"
 
-        if not port_path:
-            # Root hub fallback
-            port_path = f"usb{bus_bare}"
+        # Determine if root hub
+        is_root_hub = device.get("DEVTYPE") == "usb_device" and devpath.endswith(f"/usb{bus_bare}")
 
-        vendor_id = device.get("ID_VENDOR_ID", "0000")
-        product_id = device.get("ID_MODEL_ID", "0000")
+        # Interned: the same few IDs recur across devices and scans
+        vendor_id = sys.intern(device.get("ID_VENDOR_ID", "0000"))
+        product_id = sys.intern(device.get("ID_MODEL_ID", "0000"))
 
-        # Look up vendor and product names from usb.ids database
-        usb_db = get_usb_id_database()
-        vendor_name = usb_db.get_vendor(vendor_id)
-        product_name = usb_db.get_product(vendor_id, product_id)
+        # Vendor and product names from usb.ids are looked up lazily by USBDevice
 
         # Check for custom name in config
         custom_name = None
         if config_lookup:
-            key = f"{vendor_id}:{product_id}"
-            custom_name = config_lookup.get(key)
+            custom_name = config_lookup.get(device_key(vendor_id, product_id))
+
+        # Parse bDeviceClass once for both the raw code and classification;
+        # get_device_class reads it from sysfs only if it needs it
+        raw_class = device.get("bDeviceClass")
+        class_code = _parse_class_code(raw_class) if raw_class else None
+        driver = device.get("DRIVER")
+        if driver:
+            driver = sys.intern(driver)
+        if is_root_hub:
+            # Kernel-provided root hubs need no classification
+            device_class = DeviceClass.HUB
+        else:
+            device_class = get_device_class(device, class_code, driver or "", interfaces)
 
-        # Get number of ports for hubs
+        # Get number of ports for hubs (maxchild is only meaningful for hubs)
         num_ports = None
-        maxchild_path = Path(device.sys_path) / "maxchild"
-        if maxchild_path.exists():
+        if device_class == DeviceClass.HUB or driver == "hub":
             try:
-                num_ports = int(maxchild_path.read_text().strip())
-                if num_ports == 0:
-                    num_ports = None
-            except (ValueError, IOError):
+                num_ports = int(_read_sysfs_attr(os.path.join(devpath, "maxchild")) or "") or None
+            except ValueError:
                 pass
 
-        # Get power draw
+        # Get power draw (root hubs draw none from the bus)
         power_draw = 0
         # Try bMaxPower (USB 2.0 style)
-        max_power = device.get("bMaxPower", "")
+        max_power = None if is_root_hub else device.get("bMaxPower")
         if max_power:
             try:
                 # Format: "500mA" or just number
@@ -295,19 +517,7 @@ def build_usb_device(device: pyudev.Device, config_lookup: Optional[dict] = None
             except ValueError:
                 pass
 
-        # Determine if root hub
-        is_root_hub = device.get("DEVTYPE") == "usb_device" and devpath.endswith(f"/usb{bus_bare}")
-
-        # Calculate parent path from port path
-        # e.g., "5-1.2.4" -> parent is "5-1.2"
-        # e.g., "5-1" -> parent is "usb5"
-        parent_path = None
-        if not is_root_hub and port_path:
-            if "." in port_path:
-                parent_path = port_path.rsplit(".", 1)[0]
-            elif "-" in port_path:
-                bus = port_path.split("-")[0]
-                parent_path = f"usb{bus}"
+        parent_path = _parent_port_path(port_path) if not is_root_hub else None
 
         # Find associated device nodes (e.g., /dev/ttyACM0)
         dev_nodes = find_device_nodes(device)
@@ -318,20 +528,18 @@ def build_usb_device(device: pyudev.Device, config_lookup: Optional[dict] = None
             port_path=port_path,
             vendor_id=vendor_id,
             product_id=product_id,
-            vendor_name=vendor_name,
-            product_name=product_name,
             manufacturer=device.get("ID_VENDOR") or device.get("ID_VENDOR_FROM_DATABASE"),
             product=device.get("ID_MODEL") or device.get("ID_MODEL_FROM_DATABASE"),
             serial=device.get("ID_SERIAL_SHORT"),
-            speed=parse_speed(device.get("SPEED", "")),
+            speed=sys.intern(parse_speed(device.get("SPEED", ""))),
             usb_version=device.get("bcdUSB", ""),
-            device_class=get_device_class(device),
-            device_class_raw=int(device.get("bDeviceClass", "0") or "0", 16) if device.get("bDeviceClass") else 0,
+            device_class=device_class,
+            device_class_raw=class_code or 0,
             num_ports=num_ports,
             power_draw_ma=power_draw,
             custom_name=custom_name,
             is_root_hub=is_root_hub,
-            driver=device.get("DRIVER"),
+            driver=driver,
             parent_path=parent_path,
             dev_nodes=dev_nodes,
             children=[],
@@ -351,13 +559,25 @@ class USBMonitor:
     # Time window for grouping disconnections (100ms)
     LEARNING_WINDOW_MS = 100
 
-    def __init__(self, config_lookup: Optional[dict] = None, config_manager=None):
+    def __init__(self, config_lookup: Optional[Mapping[str, str]] = None, config_manager=None):
         self.context = pyudev.Context()
         self.monitor: Optional[pyudev.Monitor] = None
         self._running = False
+        self._readable: Optional[asyncio.Event] = None  # Set when the monitor socket is readable
         self._devices: dict[str, USBDevice] = {}  # port_path -> device
-        self._callbacks: list[Callable[[USBEvent], None]] = []
-        self.config_lookup = config_lookup or {}
+        self._hubs: dict[str, USBDevice] = {}  # The non-root hubs among _devices
+        self._tree_roots: list[USBDevice] = []  # Kept in sync with _devices by add/remove events
+        self._tree_built = False
+        # Replaced rather than mutated, so emitting iterates a stable snapshot
+        self._callbacks: tuple[Callable[[USBEvent], None], ...] = ()
+        self._tree_version = 0  # Bumped whenever a device is added or removed
+        # port_path -> events of waiters to wake when that port is added or
+        # removed; lets test_hub wait for re-enumeration instead of sleeping
+        self._port_waiters: dict[str, set[asyncio.Event]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # May be a live view from ConfigManager.get_device_lookup(); keep the
+        # same object even when empty so later name changes are picked up
+        self.config_lookup: Mapping[str, str] = config_lookup if config_lookup is not None else {}
         self.config_manager = config_manager  # For accessing saved physical groups
         # Learning mode state
         self._learning_mode = False
@@ -366,16 +586,17 @@ class USBMonitor:
 
     def register_callback(self, callback: Callable[[USBEvent], None]) -> None:
         """Register a callback for USB events."""
-        self._callbacks.append(callback)
+        self._callbacks += (callback,)
 
     def unregister_callback(self, callback: Callable[[USBEvent], None]) -> None:
         """Unregister a callback."""
         if callback in self._callbacks:
-            self._callbacks.remove(callback)
+            callbacks = list(self._callbacks)
+            callbacks.remove(callback)
+            self._callbacks = tuple(callbacks)
 
     def _emit_event(self, event: USBEvent) -> None:
         """Emit event to all registered callbacks."""
-        import time
         event.timestamp = time.time()
         for callback in self._callbacks:
             try:
@@ -385,54 +606,125 @@ class USBMonitor:
 
     def scan_devices(self) -> list[USBDevice]:
         """Scan and return all current USB devices as a tree."""
+        return self._install_scan(self._build_all(self.context))
+
+    async def rescan(self) -> list[USBDevice]:
+        """Scan all current USB devices, building them off the event loop."""
+        built = await asyncio.to_thread(self._build_all)
+        return self._install_scan(built)
+
+    def _build_all(self, context: Optional[pyudev.Context] = None) -> list[Optional[USBDevice]]:
+        """Build every connected USB device (None where one couldn't be built).
+
+        Args:
+            context: udev context to enumerate with; defaults to the calling thread's
+        """
+        if context is None:
+            context = _thread_context()
+
+        try:
+            interfaces: Optional[InterfaceIndex] = InterfaceIndex(context)
+        except Exception as e:
+            logger.debug(f"Error indexing USB interfaces: {e}")
+            interfaces = None
+
+        paths = self._list_usb_device_paths()
+        if paths is None:
+            # No sysfs listing; build from a udev enumeration instead
+            built = [
+                build_usb_device(device, self.config_lookup, interfaces)
+                for device in context.list_devices(subsystem="usb", DEVTYPE="usb_device")
+            ]
+        elif paths:
+            # Device building is mostly sysfs reads and libudev calls that
+            # release the GIL, so spread it over a few threads
+            with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(paths))) as pool:
+                built = list(pool.map(functools.partial(self._build_from_sys_path, interfaces=interfaces), paths))
+        else:
+            built = []
+        return built
+
+    def _install_scan(self, built: list[Optional[USBDevice]]) -> list[USBDevice]:
+        """Replace the device tree with freshly built devices and return its roots."""
         self._devices.clear()
+        self._hubs.clear()
         devices_flat: list[USBDevice] = []
 
-        # Get all USB devices
-        for device in self.context.list_devices(subsystem="usb", DEVTYPE="usb_device"):
-            usb_dev = build_usb_device(device, self.config_lookup)
+        for usb_dev in built:
             if usb_dev:
                 self._devices[usb_dev.port_path] = usb_dev
+                if _is_testable_hub(usb_dev):
+                    self._hubs[usb_dev.port_path] = usb_dev
                 devices_flat.append(usb_dev)
 
         # Build tree structure
-        root_devices = self._build_tree(devices_flat)
+        self._tree_roots = self._build_tree(devices_flat)
+        self._tree_built = True
+        self._tree_version += 1
+
+        return self._tree_roots
+
+    def _list_usb_device_paths(self) -> Optional[list[str]]:
+        """List sysfs paths of USB devices (not interfaces), or None if unreadable.
+
+        Filtering directory entries by name avoids a libudev enumeration that
+        loads the properties of every interface just to match DEVTYPE.
+        """
+        try:
+            with os.scandir(SYSFS_USB_DEVICES) as entries:
+                return [e.path for e in entries if _PORT_NAME_RE.fullmatch(e.name)]
+        except OSError as e:
+            logger.debug(f"Cannot scan {SYSFS_USB_DEVICES}, enumerating via udev: {e}")
+            return None
 
-        return root_devices
+    def _build_from_sys_path(
+        self, sys_path: str, interfaces: Optional[InterfaceIndex] = None
+    ) -> Optional[USBDevice]:
+        """Build a device from its sysfs path; runs on scan worker threads."""
+        try:
+            device = pyudev.Devices.from_sys_path(_thread_context(), sys_path)
+        except pyudev.DeviceNotFoundError:
+            return None  # Unplugged while scanning
+        return build_usb_device(device, self.config_lookup, interfaces)
 
     def _build_tree(self, devices: list[USBDevice]) -> list[USBDevice]:
-        """Build hierarchical tree from flat device list."""
-        # Sort by port path length to process parents before children
-        devices.sort(key=lambda d: len(d.port_path))
+        """Build hierarchical tree from flat device list.
 
+        Devices are placed in a trie keyed by bus number and then each port
+        number along their port path ("5-1.2.4" -> 5, 1, 2, 4), and linked
+        to their parents in one depth-first walk; siblings come out in port
+        order. A device whose direct parent wasn't found becomes a root.
+        """
         roots: list[USBDevice] = []
-        path_map: dict[str, USBDevice] = {d.port_path: d for d in devices}
+        # Trie node: [device at this path or None, {port number: child node}]
+        buses: dict[int, list] = {}
 
         for device in devices:
-            if device.is_root_hub or device.port_path.startswith("usb"):
-                roots.append(device)
-                continue
-
-            # Find parent by trimming port path
-            # e.g., "5-1.2.4" -> parent is "5-1.2"
-            port_path = device.port_path
-            if "." in port_path:
-                parent_path = port_path.rsplit(".", 1)[0]
-            elif "-" in port_path:
-                # Direct child of root hub, e.g., "5-1" -> parent is "usb5"
-                bus = port_path.split("-")[0]
-                parent_path = f"usb{bus}"
-            else:
+            key = _port_sort_key(device.port_path)
+            if not key:
                 roots.append(device)
                 continue
-
-            parent = path_map.get(parent_path)
-            if parent:
-                device.parent_path = parent_path
-                parent.children.append(device)
-            else:
-                # No parent found, treat as root
-                roots.append(device)
+            node = buses.setdefault(key[0], [None, {}])
+            for port in key[1:]:
+                node = node[1].setdefault(port, [None, {}])
+            node[0] = device
+
+        stack: list[tuple[list, Optional[USBDevice]]] = [
+            (buses[bus], None) for bus in sorted(buses, reverse=True)
+        ]
+        while stack:
+            (device, children), parent = stack.pop()
+            if device is not None:
+                if parent is None:
+                    roots.append(device)
+                else:
+                    # Invalidate only on change, to keep the serialized cache
+                    if device.parent_path != parent.port_path:
+                        device.parent_path = parent.port_path
+                        device.invalidate_cache()
+                    parent.children.append(device)
+            # Children of an empty node have no parent in the tree
+            stack.extend((children[port], device) for port in sorted(children, reverse=True))
 
         return roots
 
@@ -440,9 +732,59 @@ class USBMonitor:
         """Get device by port path."""
         return self._devices.get(port_path)
 
+    @property
+    def tree_version(self) -> int:
+        """Counter that changes whenever the device topology changes."""
+        return self._tree_version
+
     def get_tree(self) -> list[USBDevice]:
-        """Get current device tree."""
-        return self.scan_devices()
+        """Get current device tree.
+
+        The tree is scanned once and then maintained incrementally from udev
+        add/remove events; call scan_devices() to force a full rescan.
+        """
+        if not self._tree_built:
+            return self.scan_devices()
+
+        self._apply_custom_names()
+        return self._tree_roots
+
+    def _apply_custom_names(self) -> None:
+        """Bring custom names up to date; they may have changed since devices were built."""
+        for device in list(self._devices.values()):
+            custom_name = self.config_lookup.get(device.config_key)
+            if device.custom_name != custom_name:
+                device.set_custom_name(custom_name)
+
+    def _attach(self, device: USBDevice) -> None:
+        """Insert a newly added device into the tree under its parent."""
+        old = self._devices.get(device.port_path)
+        if old is not None:
+            # Device announced again (e.g. seen by the initial scan too):
+            # take over the existing subtree
+            device.children = old.children
+            self._detach(old)
+
+        self._devices[device.port_path] = device
+        if _is_testable_hub(device):
+            self._hubs[device.port_path] = device
+        else:
+            self._hubs.pop(device.port_path, None)
+        parent = self._devices.get(device.parent_path) if device.parent_path else None
+        siblings = parent.children if parent is not None else self._tree_roots
+        # Keep port order, as a full scan would list them
+        keys = [_port_sort_key(sibling.port_path) for sibling in siblings]
+        siblings.insert(bisect.bisect_right(keys, _port_sort_key(device.port_path)), device)
+
+    def _detach(self, device: USBDevice) -> None:
+        """Unlink a device from its parent's children (or the roots)."""
+        parent = self._devices.get(device.parent_path) if device.parent_path else None
+        # Orphans (parent unknown when attached) live in the roots
+        for siblings in (parent.children if parent is not None else [], self._tree_roots):
+            for i, sibling in enumerate(siblings):
+                if sibling is device:
+                    del siblings[i]
+                    return
 
     async def start_monitoring(self) -> None:
         """Start monitoring USB events asynchronously."""
@@ -450,14 +792,102 @@ class USBMonitor:
             return
 
         self.monitor = pyudev.Monitor.from_netlink(self.context)
-        self.monitor.filter_by(subsystem="usb", device_type="usb_device")
+        # Interface events are wanted too: their driver binds come after
+        # the device's "add"
+        self.monitor.filter_by(subsystem="usb")
+        try:
+            # Forcing the size past the system limit needs CAP_NET_ADMIN
+            self.monitor.set_receive_buffer_size(MONITOR_RECEIVE_BUFFER)
+        except OSError as e:
+            logger.debug(f"Cannot enlarge udev monitor receive buffer: {e}")
         self._running = True
 
+        # Start receiving before the initial scan so no event falls in between;
+        # events for devices the scan already found just replace them
+        self.monitor.start()
+        self.scan_devices()
+
         logger.info("USB monitoring started")
 
-        # Run in thread to avoid blocking
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self._monitor_loop)
+        loop = self._loop = asyncio.get_running_loop()
+        readable = self._readable = asyncio.Event()
+        try:
+            loop.add_reader(self.monitor.fileno(), readable.set)
+        except NotImplementedError:
+            # Event loop without reader support; block in a thread instead
+            await loop.run_in_executor(None, self._monitor_loop)
+            return
+
+        # Receive events on the loop thread as the netlink socket becomes
+        # readable, rather than tying up a thread blocked in poll(). Devices
+        # are built on a worker, one event at a time so they apply in order.
+        try:
+            while self._running:
+                await readable.wait()
+                readable.clear()
+                for device in self._drain_monitor():
+                    usb_dev = None
+                    sys_path = _event_build_path(device)
+                    if sys_path:
+                        usb_dev = await loop.run_in_executor(None, self._build_from_sys_path, sys_path)
+                    self._apply_udev_event(device, usb_dev)
+        finally:
+            loop.remove_reader(self.monitor.fileno())
+            self._readable = None
+
+    def _drain_monitor(self) -> list[pyudev.Device]:
+        """Receive every udev event already queued on the monitor."""
+        devices: list[pyudev.Device] = []
+        while self._running and self.monitor:
+            device = self.monitor.poll(timeout=0)
+            if device is None:
+                break
+            devices.append(device)
+        return devices
+
+    def _notify_port(self, port_path: str) -> None:
+        """Wake anything waiting on port_path to appear or disappear."""
+        if port_path in self._port_waiters and self._loop is not None:
+            # Thread-safe, since the fallback monitor loop runs off the loop thread
+            self._loop.call_soon_threadsafe(self._wake_port_waiters, port_path)
+
+    def _wake_port_waiters(self, port_path: str) -> None:
+        for event in self._port_waiters.get(port_path, ()):
+            event.set()
+
+    async def _wait_for_ports(self, port_paths: Iterable[str], present: bool, timeout: float) -> bool:
+        """Wait until every port in port_paths is connected (or gone).
+
+        Woken by udev add/remove events, so this returns as soon as the
+        kernel has re-enumerated rather than after a fixed delay.
+
+        Returns:
+            False if timeout elapsed first
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for port_path in port_paths:
+            if (port_path in self._devices) == present:
+                continue
+            event = asyncio.Event()
+            waiters = self._port_waiters.setdefault(port_path, set())
+            waiters.add(event)
+            try:
+                while (port_path in self._devices) != present:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        return False
+                    try:
+                        await asyncio.wait_for(event.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass  # Re-checked above, then reported as timed out
+                    event.clear()
+            finally:
+                # Registered only while waiting, so ports don't accumulate
+                waiters.discard(event)
+                if not waiters:
+                    del self._port_waiters[port_path]
+        return True
 
     def _monitor_loop(self) -> None:
         """Blocking monitor loop (runs in thread)."""
@@ -467,52 +897,83 @@ class USBMonitor:
         for device in iter(self.monitor.poll, None):
             if not self._running:
                 break
+            self._handle_udev_event(device)
+
+    def _handle_udev_event(self, device: pyudev.Device) -> None:
+        """Build the device for a udev event and apply it (fallback monitor thread)."""
+        sys_path = _event_build_path(device)
+        usb_dev = self._build_from_sys_path(sys_path) if sys_path else None
+        self._apply_udev_event(device, usb_dev)
 
-            action = device.action
-
-            if action == "add":
-                usb_dev = build_usb_device(device, self.config_lookup)
-                if usb_dev:
-                    self._devices[usb_dev.port_path] = usb_dev
-                    event = USBEvent(type=EventType.DEVICE_ADDED, device=usb_dev)
-                    self._emit_event(event)
-                    logger.info(f"Device added: {usb_dev.display_name} at {usb_dev.port_path}")
-
-            elif action == "remove":
-                import time
-                # Try to find device by sys_path
-                port_path = None
-                devpath = device.sys_path
-                parts = devpath.split("/")
-                for part in reversed(parts):
-                    if "-" in part and not part.startswith("pci"):
-                        port_path = part
-                        break
-
-                if port_path and port_path in self._devices:
-                    removed_device = self._devices.pop(port_path)
-
-                    # Track disconnect if in learning mode
-                    if self._learning_mode:
-                        disconnect_time = time.time()
-                        self._learning_disconnects.append((disconnect_time, port_path, removed_device))
-                        logger.debug(f"Learning mode: tracked disconnect of {removed_device.display_name}")
-
-                        # Emit learning detected event after a short delay to group disconnects
-                        # This is handled by the frontend checking learning_data
-
-                    event = USBEvent(
-                        type=EventType.DEVICE_REMOVED,
-                        port_path=port_path,
-                        device=removed_device,
-                        learning_data={"in_learning_mode": self._learning_mode} if self._learning_mode else None
-                    )
-                    self._emit_event(event)
-                    logger.info(f"Device removed: {removed_device.display_name} from {port_path}")
+    def _apply_udev_event(self, device: pyudev.Device, usb_dev: Optional[USBDevice]) -> None:
+        """Update the tree for a udev event and notify callbacks.
+
+        Args:
+            device: The udev event's device
+            usb_dev: The USB device (re)built for the event, if it could be built
+        """
+        action = device.action
+
+        if usb_dev:
+            old = self._devices.get(usb_dev.port_path)
+            if action != "add" and old is not None:
+                self._update_device(usb_dev, old)
+            else:
+                self._attach(usb_dev)
+                self._tree_version += 1
+                self._notify_port(usb_dev.port_path)
+                event = USBEvent(type=EventType.DEVICE_ADDED, device=usb_dev)
+                self._emit_event(event)
+                logger.info(f"Device added: {usb_dev.display_name} at {usb_dev.port_path}")
+
+        elif action == "remove" and device.get("DEVTYPE") == "usb_device":
+            # Try to find device by sys_path
+            port_path = _port_path_from_sys_path(device.sys_path)
+
+            if port_path and port_path in self._devices:
+                removed_device = self._devices[port_path]
+                self._detach(removed_device)
+                del self._devices[port_path]
+                self._hubs.pop(port_path, None)
+                self._tree_version += 1
+                self._notify_port(port_path)
+
+                # Track disconnect if in learning mode
+                if self._learning_mode:
+                    disconnect_time = time.time()
+                    self._learning_disconnects.append((disconnect_time, port_path, removed_device))
+                    logger.debug(f"Learning mode: tracked disconnect of {removed_device.display_name}")
+
+                    # Emit learning detected event after a short delay to group disconnects
+                    # This is handled by the frontend checking learning_data
+
+                event = USBEvent(
+                    type=EventType.DEVICE_REMOVED,
+                    port_path=port_path,
+                    device=removed_device,
+                    learning_data={"in_learning_mode": self._learning_mode} if self._learning_mode else None
+                )
+                self._emit_event(event)
+                logger.info(f"Device removed: {removed_device.display_name} from {port_path}")
+
+    def _update_device(self, usb_dev: USBDevice, old: USBDevice) -> None:
+        """Replace a known device with its rebuild, if anything shown changed."""
+        # Errors come from dmesg, not udev
+        usb_dev.errors = old.errors
+        if usb_dev._frontend_fields() == old._frontend_fields():
+            return
+
+        self._attach(usb_dev)
+        self._tree_version += 1
+        self._emit_event(USBEvent(type=EventType.DEVICE_UPDATED, device=usb_dev))
+        logger.debug(f"Device updated: {usb_dev.display_name} at {usb_dev.port_path}")
 
     def stop_monitoring(self) -> None:
         """Stop monitoring USB events."""
         self._running = False
+        if self._readable is not None:
+            # Wake start_monitoring so it unregisters the reader and returns
+            self._readable.set()
         logger.info("USB monitoring stopped")
 
     # Learning mode methods
@@ -523,23 +984,15 @@ class USBMonitor:
         If port_path is provided, only check devices under that path.
         Returns list of storage devices found.
         """
-        storage_devices = []
-
-        def check_device(device: USBDevice) -> None:
-            if device.device_class == DeviceClass.STORAGE:
-                storage_devices.append(device)
-            for child in device.children:
-                check_device(child)
-
-        for device in self._devices.values():
-            if port_path:
-                # Only check if this device is under the specified path
-                if device.port_path.startswith(port_path) or port_path.startswith(device.port_path):
-                    check_device(device)
-            else:
-                check_device(device)
+        devices: Iterable[USBDevice]
+        if port_path:
+            device = self._devices.get(port_path)
+            devices = _walk_tree((device,)) if device else ()
+        else:
+            # Every device is in the flat map, so no tree walk is needed
+            devices = self._devices.values()
 
-        return storage_devices
+        return [d for d in devices if d.device_class == DeviceClass.STORAGE]
 
     def get_hubs_with_storage(self) -> list[dict]:
         """Get list of hubs that have storage devices attached."""
@@ -547,12 +1000,13 @@ class USBMonitor:
 
         def find_parent_hub(device: USBDevice) -> Optional[USBDevice]:
             """Find the hub that this device is connected to."""
-            if device.parent_path:
+            while device.parent_path:
                 parent = self._devices.get(device.parent_path)
-                if parent and parent.device_class == DeviceClass.HUB:
+                if parent is None:
+                    break
+                if parent.device_class == DeviceClass.HUB:
                     return parent
-                elif parent:
-                    return find_parent_hub(parent)
+                device = parent
             return None
 
         for device in self._devices.values():
@@ -577,7 +1031,6 @@ class USBMonitor:
         Returns:
             dict with status and any warnings
         """
-        import time
 
         storage_devices = self.has_storage_devices()
         hubs_with_storage = self.get_hubs_with_storage()
@@ -614,7 +1067,6 @@ class USBMonitor:
         Returns:
             dict with detected group info if save=True
         """
-        import time
 
         if not self._learning_mode:
             return {"status": "not_in_learning_mode"}
@@ -668,37 +1120,24 @@ class USBMonitor:
         if existing_group_members:
             logger.info(f"Excluding {len(existing_group_members)} hubs already in saved groups: {existing_group_members}")
 
-        # Sort by timestamp
-        self._learning_disconnects.sort(key=lambda x: x[0])
-
-        # Group events within the time window
-        groups: list[list[tuple[float, str, USBDevice]]] = []
-        current_group: list[tuple[float, str, USBDevice]] = []
-
-        for disconnect in self._learning_disconnects:
-            timestamp, port_path, device = disconnect
-
-            if not current_group:
-                current_group = [disconnect]
-            elif (timestamp - current_group[0][0]) * 1000 <= self.LEARNING_WINDOW_MS:
-                # Within time window of first event in group
-                current_group.append(disconnect)
-            else:
-                # New group
-                if current_group:
-                    groups.append(current_group)
-                current_group = [disconnect]
-
-        if current_group:
-            groups.append(current_group)
+        # Sort by timestamp (they are normally recorded in order already)
+        disconnects = self._learning_disconnects
+        disconnects.sort(key=operator.itemgetter(0))
+        timestamps = [disconnect[0] for disconnect in disconnects]
+        window = self.LEARNING_WINDOW_MS / 1000
+
+        # Group events within the time window of each group's first event,
+        # finding each group's end by bisection; keep the first largest group
+        largest_group: list[tuple[float, str, USBDevice]] = []
+        start = 0
+        while start < len(disconnects):
+            end = bisect.bisect_right(timestamps, timestamps[start] + window, start)
+            if end - start > len(largest_group):
+                largest_group = disconnects[start:end]
+            start = end
 
         # Find the largest group (most likely to be a physical device disconnect)
-        if not groups:
-            return None
-
-        largest_group = max(groups, key=len)
-
-        if len(largest_group) < 1:
+        if not largest_group:
             return None
 
         # Build the result - only include HUB devices that aren't already in saved groups
@@ -750,48 +1189,28 @@ class USBMonitor:
             List of hub info dicts with port_path, name, has_storage
         """
         hubs = []
+        roots = [d for d in self._devices.values() if d.parent_path is None or d.is_root_hub]
 
-        def collect_hubs(device: USBDevice, parent_is_root: bool = False):
+        for device in _walk_tree(roots):
             # Skip root hubs - we can't disable those
             if device.is_root_hub:
-                for child in device.children:
-                    collect_hubs(child, parent_is_root=True)
-                return
+                continue
 
             if device.device_class == DeviceClass.HUB:
-                # Check if this hub has storage devices under it
-                has_storage = self._hub_has_storage(device)
                 hubs.append({
                     "port_path": device.port_path,
                     "name": device.display_name,
                     "vendor_id": device.vendor_id,
                     "product_id": device.product_id,
-                    "has_storage": has_storage,
+                    # Check if this hub has storage devices under it
+                    "has_storage": self._hub_has_storage(device),
                 })
 
-            for child in device.children:
-                collect_hubs(child)
-
-        for device in self._devices.values():
-            if device.parent_path is None or device.is_root_hub:
-                collect_hubs(device)
-
         return hubs
 
     def _hub_has_storage(self, hub: USBDevice) -> bool:
         """Check if a hub has any storage devices connected under it."""
-        def check_children(device: USBDevice) -> bool:
-            if device.device_class == DeviceClass.STORAGE:
-                return True
-            for child in device.children:
-                if check_children(child):
-                    return True
-            return False
-
-        for child in hub.children:
-            if check_children(child):
-                return True
-        return False
+        return any(d.device_class == DeviceClass.STORAGE for d in _walk_tree(hub.children))
 
     def _get_all_hub_descendants(self, hub_path: str) -> list[str]:
         """Get all hub port paths that are descendants of the given hub."""
@@ -799,20 +1218,13 @@ class USBMonitor:
         if not hub:
             return []
 
-        descendants = []
+        return [
+            d.port_path
+            for d in _walk_tree(hub.children)
+            if d.device_class == DeviceClass.HUB and d.port_path != hub_path
+        ]
 
-        def collect(device: USBDevice):
-            if device.device_class == DeviceClass.HUB and device.port_path != hub_path:
-                descendants.append(device.port_path)
-            for child in device.children:
-                collect(child)
-
-        for child in hub.children:
-            collect(child)
-
-        return descendants
-
-    async def test_hub(self, port_path: str) -> dict:
+    async def test_hub(self, port_path: str, expected_size: Optional[int] = None) -> dict:
         """Test a hub by disabling and re-enabling it.
 
         Uses depth-first testing to identify only hubs that are truly part of
@@ -828,13 +1240,12 @@ class USBMonitor:
 
         Args:
             port_path: The port path of the hub to test
+            expected_size: Number of hubs in the physical device, if known;
+                stops testing candidates once that many have been found
 
         Returns:
             dict with detected hub group info
         """
-        import asyncio
-        from pathlib import Path
-
         # Verify the hub exists
         hub = self._devices.get(port_path)
         if not hub:
@@ -842,18 +1253,20 @@ class USBMonitor:
         if hub.device_class != DeviceClass.HUB:
             return {"status": "error", "message": "Not a hub device"}
 
-        # Get the sysfs path
-        sysfs_path = Path(f"/sys/bus/usb/devices/{port_path}")
-        authorized_path = sysfs_path / "authorized"
-
-        if not authorized_path.exists():
+        # One descriptor for both writes; the attribute stays put while the
+        # hub is deauthorized
+        try:
+            fd = _open_authorized(port_path)
+        except FileNotFoundError:
             return {"status": "error", "message": "Cannot access hub (sysfs path not found)"}
+        except PermissionError:
+            return {"status": "error", "message": "Permission denied. Run with sudo."}
+        except OSError as e:
+            logger.error(f"Cannot open authorized attribute of {port_path}: {e}")
+            return {"status": "error", "message": f"Cannot access hub: {e}"}
 
         # Record current state - get all hubs before disabling
-        hubs_before = set(
-            p for p, d in self._devices.items()
-            if d.device_class == DeviceClass.HUB and not d.is_root_hub
-        )
+        hubs_before = set(self._hubs)
 
         logger.info(f"Testing hub {port_path} - phase 1: finding candidates...")
 
@@ -861,20 +1274,19 @@ class USBMonitor:
 
         try:
             # Phase 1: Disable target hub and find all hubs that disappear
-            authorized_path.write_text("0")
+            await _set_authorized(fd, b"0")
+            # Which hubs will vanish is what we're finding out, so there is
+            # nothing specific to wait for here
             await asyncio.sleep(0.4)
 
-            hubs_after = set(
-                p for p, d in self._devices.items()
-                if d.device_class == DeviceClass.HUB and not d.is_root_hub
-            )
+            hubs_after = set(self._hubs)
 
             candidate_hubs = hubs_before - hubs_after
             logger.info(f"Phase 1: {len(candidate_hubs)} candidate hubs disappeared")
 
             # Re-enable target hub
-            authorized_path.write_text("1")
-            await asyncio.sleep(0.8)  # Wait for full reconnection
+            await _set_authorized(fd, b"1")
+            await self._wait_for_ports(candidate_hubs, True, 0.8)  # Wait for full reconnection
 
         except PermissionError:
             return {"status": "error", "message": "Permission denied. Run with sudo."}
@@ -882,29 +1294,43 @@ class USBMonitor:
             logger.exception(f"Error in phase 1: {e}")
             # Try to re-enable
             try:
-                authorized_path.write_text("1")
-            except:
+                os.pwrite(fd, b"1", 0)
+            except OSError:
                 pass
             return {"status": "error", "message": str(e)}
+        finally:
+            os.close(fd)
 
         # Phase 2: Test each candidate to see if it's truly part of same physical device
         # A hub is part of the same physical device if disabling IT also makes
         # our target hub disappear (bidirectional dependency)
         same_device_hubs = {port_path}  # Target is always included
 
-        for candidate in candidate_hubs:
-            candidate_sysfs = Path(f"/sys/bus/usb/devices/{candidate}")
-            candidate_auth = candidate_sysfs / "authorized"
+        # Try the hub at the same ports on another bus first: that's where
+        # the other half of a USB 3 hub sits, and the likeliest match
+        port_chain = port_path.partition("-")[2]
+        # The target itself disappears in phase 1 too; testing it proves nothing
+        candidates = sorted(
+            candidate_hubs - same_device_hubs,
+            key=lambda c: (c.partition("-")[2] != port_chain, c),
+        )
+
+        for candidate in candidates:
+            if expected_size is not None and len(same_device_hubs) >= expected_size:
+                logger.info(f"Phase 2: found all {expected_size} expected hubs, skipping the rest")
+                break
 
-            if not candidate_auth.exists():
+            try:
+                candidate_fd = _open_authorized(candidate)
+            except OSError:
                 continue
 
             logger.info(f"Phase 2: Testing candidate {candidate}...")
 
             try:
                 # Disable the candidate
-                candidate_auth.write_text("0")
-                await asyncio.sleep(0.3)
+                await _set_authorized(candidate_fd, b"0")
+                await self._wait_for_ports((port_path,), False, 0.3)
 
                 # Check if target hub is still present
                 target_still_exists = port_path in self._devices
@@ -918,16 +1344,18 @@ class USBMonitor:
                     logger.info(f"  {candidate} is SEPARATE device (downstream only)")
 
                 # Re-enable the candidate
-                candidate_auth.write_text("1")
-                await asyncio.sleep(0.5)
+                await _set_authorized(candidate_fd, b"1")
+                await self._wait_for_ports(candidate_hubs, True, 0.5)
 
             except Exception as e:
                 logger.warning(f"Error testing candidate {candidate}: {e}")
                 # Try to re-enable
                 try:
-                    candidate_auth.write_text("1")
-                except:
+                    os.pwrite(candidate_fd, b"1", 0)
+                except OSError:
                     pass
+            finally:
+                os.close(candidate_fd)
 
         logger.info(f"Detection complete: {len(same_device_hubs)} hubs in physical group")
 
@@ -936,7 +1364,7 @@ class USBMonitor:
         devices_info = []
 
         # Wait a bit more for devices to fully reconnect
-        await asyncio.sleep(0.3)
+        await self._wait_for_ports(members, True, 0.3)
 
         # Get device info
         for member_path in members:
@@ -6,6 +6,13 @@ Parses /usr/share/hwdata/usb.ids to map vendor/product IDs to names.
 
 from __future__ import annotations
 import logging
+import marshal
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
 from pathlib import Path
 from typing import Optional
 
@@ -19,13 +26,115 @@ USB_IDS_PATHS = [
     "/var/lib/usbutils/usb.ids",
 ]
 
+# One line of interest in usb.ids: a vendor ("XXXX  Name"), a product under the
+# current vendor ("<tab>YYYY  Name") or any other top-level, non-comment line,
+# which ends the current vendor's product list. Names are captured up to the
+# end of the line, including any trailing whitespace.
+_ENTRY_RE = re.compile(
+    rb"^(?:([0-9a-fA-F]{4})[ \t]+(\S[^\r\n]*)"
+    rb"|\t([0-9a-fA-F]{4})[ \t]+(\S[^\r\n]*)"
+    rb"|[^\s#])",
+    re.MULTILINE,
+)
+
+# Parsed databases are cached here (marshal format), keyed by the source file
+CACHE_FILENAME = "usb_ids.marshal"
+# Bump when the cached data layout changes
+_CACHE_FORMAT = 4
+
+
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
+
+def _parse_id(value: str) -> Optional[int]:
+    """Parse a 4-character hex USB ID, or None if it isn't one."""
+    # int() alone would also take signs, spaces, underscores and a 0x prefix
+    if not isinstance(value, str) or len(value) != 4 or not _HEX_DIGITS.issuperset(value):
+        return None
+    # Plain int() on purpose: it runs in C, whereas decoding the four digits
+    # through a Python lookup table takes about twice as long
+    return int(value, 16)
+
+
+def _cache_path() -> Optional[Path]:
+    """Location of the parsed database cache, or None if caching is disabled."""
+    if os.environ.get("USB_EXPLORER_NO_CACHE", "").lower() in ("1", "true", "yes"):
+        return None
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home:
+        return Path(cache_home) / "usb_explorer" / CACHE_FILENAME
+    try:
+        return Path.home() / ".cache" / "usb_explorer" / CACHE_FILENAME
+    except RuntimeError:
+        return None
+
+
+def _cache_key(path: Path) -> str:
+    """Identify a usb.ids file version by path, modification time and size."""
+    st = path.stat()
+    return f"{_CACHE_FORMAT}:{path.resolve()}:{st.st_mtime_ns}:{st.st_size}"
+
+
+class _IDTable:
+    """Names keyed by integer ID, stored as sorted arrays searched by bisection.
+
+    Far more compact than a dict for the tens of thousands of usb.ids
+    entries: keys are packed 32-bit integers in one contiguous array, and
+    the UTF-8 names are concatenated into a single bytes blob indexed by an
+    offset array, so no per-entry objects exist until a name is looked up.
+    """
+
+    __slots__ = ("keys", "offsets", "blob")
+
+    def __init__(
+        self,
+        keys: Optional[array] = None,
+        offsets: Optional[array] = None,
+        blob: bytes = b"",
+    ):
+        self.keys = keys if keys is not None else array("I")
+        # Name i is blob[offsets[i]:offsets[i + 1]]
+        self.offsets = offsets if offsets is not None else array("I", (0,))
+        self.blob = blob
+
+    @classmethod
+    def from_dict(cls, entries: dict[int, bytes]) -> _IDTable:
+        keys = sorted(entries)
+        names = [entries[k] for k in keys]
+        offsets = array("I", (0,))
+        offsets.extend(accumulate(map(len, names)))
+        return cls(array("I", keys), offsets, b"".join(names))
+
+    @classmethod
+    def from_marshal(cls, data: tuple[bytes, bytes, bytes]) -> _IDTable:
+        keys = array("I")
+        keys.frombytes(data[0])
+        offsets = array("I")
+        offsets.frombytes(data[1])
+        if len(offsets) != len(keys) + 1 or offsets[-1] != len(data[2]):
+            raise ValueError("inconsistent USB ID table")
+        return cls(keys, offsets, data[2])
+
+    def to_marshal(self) -> tuple[bytes, bytes, bytes]:
+        return (self.keys.tobytes(), self.offsets.tobytes(), self.blob)
+
+    def get(self, key: int) -> Optional[str]:
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.blob[self.offsets[i]:self.offsets[i + 1]].decode("utf-8", "replace")
+        return None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
 
 class USBIDDatabase:
     """Lookup vendor and product names from USB ID database."""
 
     def __init__(self):
-        self._vendors: dict[str, str] = {}  # vendor_id -> vendor_name
-        self._products: dict[str, dict[str, str]] = {}  # vendor_id -> {product_id -> product_name}
+        # IDs are stored as integers; products are keyed by vendor << 16 | product
+        self._vendors = _IDTable()  # vendor_id -> vendor_name
+        self._products = _IDTable()  # (vendor_id << 16 | product_id) -> product_name
         self._loaded = False
 
     def load(self, path: Optional[str] = None) -> bool:
@@ -60,7 +169,9 @@ class USBIDDatabase:
             return False
 
         try:
-            self._parse_usb_ids(usb_ids_path)
+            if not self._load_cache(usb_ids_path):
+                self._parse_usb_ids(usb_ids_path)
+                self._save_cache(usb_ids_path)
             self._loaded = True
             logger.info(f"Loaded {len(self._vendors)} vendors from {usb_ids_path}")
             return True
@@ -68,6 +179,44 @@ class USBIDDatabase:
             logger.exception(f"Failed to parse USB ID database: {e}")
             return False
 
+    def _load_cache(self, path: Path) -> bool:
+        """Load the parsed database from the on-disk cache if it matches path.
+
+        Returns:
+            True if the cache was valid and has been loaded
+        """
+        cache_path = _cache_path()
+        if cache_path is None:
+            return False
+        try:
+            # loads() on the whole file; load(f) reads object by object
+            key, vendors, products = marshal.loads(cache_path.read_bytes())
+            if key != _cache_key(path):
+                return False
+            # A corrupt cache is re-parsed (and rewritten) like a stale one
+            vendor_table = _IDTable.from_marshal(vendors)
+            product_table = _IDTable.from_marshal(products)
+        except (OSError, EOFError, ValueError, TypeError, IndexError):
+            return False
+        self._vendors = vendor_table
+        self._products = product_table
+        logger.debug(f"Loaded USB ID database from cache {cache_path}")
+        return True
+
+    def _save_cache(self, path: Path) -> None:
+        """Write the parsed database to the on-disk cache (best effort)."""
+        cache_path = _cache_path()
+        if cache_path is None:
+            return
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(cache_path.suffix + ".tmp")
+            data = (_cache_key(path), self._vendors.to_marshal(), self._products.to_marshal())
+            tmp_path.write_bytes(marshal.dumps(data))
+            tmp_path.replace(cache_path)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Could not write USB ID cache {cache_path}: {e}")
+
     def _parse_usb_ids(self, path: Path) -> None:
         """Parse the usb.ids file format.
 
@@ -76,45 +225,34 @@ class USBIDDatabase:
         XXXX  Vendor Name
         <tab>YYYY  Product Name
         <tab>ZZZZ  Another Product
+
+        The file is memory-mapped and scanned in a single regex pass rather
+        than decoded and split line by line.
         """
-        current_vendor = None
-
-        with open(path, "r", encoding="utf-8", errors="replace") as f:
-            for line in f:
-                # Skip empty lines and comments
-                if not line.strip() or line.startswith("#"):
-                    continue
-
-                # Check for vendor line (no leading whitespace, starts with hex)
-                if not line[0].isspace():
-                    parts = line.strip().split(None, 1)
-                    if len(parts) >= 2 and len(parts[0]) == 4:
-                        try:
-                            # Verify it's a valid hex vendor ID
-                            int(parts[0], 16)
-                            vendor_id = parts[0].lower()
-                            vendor_name = parts[1]
-                            self._vendors[vendor_id] = vendor_name
-                            self._products[vendor_id] = {}
-                            current_vendor = vendor_id
-                        except ValueError:
-                            # Not a vendor line (might be a class definition)
-                            current_vendor = None
+        current_vendor: Optional[int] = None
+        # Collected in dicts (later entries win), then packed into tables.
+        # Product lines far outnumber the rest.
+        vendors: dict[int, bytes] = {}
+        products: dict[int, bytes] = {}
+
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for match in _ENTRY_RE.finditer(data):
+                    vendor_id, vendor_name, product_id, product_name = match.groups()
+                    if product_id is not None:
+                        if current_vendor is not None:
+                            products[current_vendor << 16 | int(product_id, 16)] = product_name.rstrip()
+                    elif vendor_id is not None:
+                        current_vendor = int(vendor_id, 16)
+                        vendors[current_vendor] = vendor_name.rstrip()
                     else:
+                        # Some other top-level line (e.g. a class definition)
                         current_vendor = None
 
-                # Check for product line (starts with tab, under current vendor)
-                elif line.startswith("\t") and not line.startswith("\t\t"):
-                    if current_vendor:
-                        parts = line.strip().split(None, 1)
-                        if len(parts) >= 2 and len(parts[0]) == 4:
-                            try:
-                                int(parts[0], 16)
-                                product_id = parts[0].lower()
-                                product_name = parts[1]
-                                self._products[current_vendor][product_id] = product_name
-                            except ValueError:
-                                pass
+        self._vendors = _IDTable.from_dict(vendors)
+        self._products = _IDTable.from_dict(products)
 
     def get_vendor(self, vendor_id: str) -> Optional[str]:
         """Get vendor name by ID.
@@ -127,7 +265,10 @@ class USBIDDatabase:
         """
         if not self._loaded:
             self.load()
-        return self._vendors.get(vendor_id.lower())
+        vendor = _parse_id(vendor_id)
+        if vendor is None:
+            return None
+        return self._vendors.get(vendor)
 
     def get_product(self, vendor_id: str, product_id: str) -> Optional[str]:
         """Get product name by vendor and product ID.
@@ -141,10 +282,11 @@ class USBIDDatabase:
         """
         if not self._loaded:
             self.load()
-        vendor_products = self._products.get(vendor_id.lower())
-        if vendor_products:
-            return vendor_products.get(product_id.lower())
-        return None
+        vendor = _parse_id(vendor_id)
+        product = _parse_id(product_id)
+        if vendor is None or product is None:
+            return None
+        return self._products.get(vendor << 16 | product)
 
     def lookup(self, vendor_id: str, product_id: str) -> tuple[Optional[str], Optional[str]]:
         """Look up both vendor and product names.
@@ -156,7 +298,14 @@ class USBIDDatabase:
         Returns:
             Tuple of (vendor_name, product_name), either may be None
         """
-        return (self.get_vendor(vendor_id), self.get_product(vendor_id, product_id))
+        if not self._loaded:
+            self.load()
+        vendor = _parse_id(vendor_id)
+        if vendor is None:
+            return (None, None)
+        product = _parse_id(product_id)
+        product_name = self._products.get(vendor << 16 | product) if product is not None else None
+        return (self._vendors.get(vendor), product_name)
 
 
 # Global instance for shared use
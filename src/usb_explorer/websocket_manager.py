@@ -8,63 +8,129 @@ from __future__ import annotations
 import asyncio
 import logging
 from typing import Any
+import orjson
 from fastapi import WebSocket
 
 from .models import USBEvent
 
 logger = logging.getLogger(__name__)
 
+# A client that can't take a message within this long is dropped
+SEND_TIMEOUT_SECONDS = 2.0
+
+# Messages held for a client that is behind; one that falls further behind
+# is disconnected and resyncs from the full tree when it reconnects
+SEND_QUEUE_SIZE = 256
+
 
 class WebSocketManager:
     """Manages WebSocket connections and broadcasts."""
 
     def __init__(self):
-        self._connections: list[WebSocket] = []
-        self._lock = asyncio.Lock()
+        # websocket -> (its pending messages, the task sending them)
+        self._connections: dict[WebSocket, tuple[asyncio.Queue[str], asyncio.Task[None]]] = {}
+        self._event_queue: asyncio.Queue[USBEvent] = asyncio.Queue()
 
     async def connect(self, websocket: WebSocket) -> None:
         """Accept a new WebSocket connection."""
         await websocket.accept()
-        async with self._lock:
-            self._connections.append(websocket)
+        # Everything here runs on the event loop thread and each update is a
+        # single dict operation, so no lock is needed around _connections
+        queue: asyncio.Queue[str] = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        sender = asyncio.create_task(self._run_sender(websocket, queue))
+        self._connections[websocket] = (queue, sender)
         logger.info(f"WebSocket connected. Total connections: {len(self._connections)}")
 
     async def disconnect(self, websocket: WebSocket) -> None:
         """Remove a WebSocket connection."""
-        async with self._lock:
-            if websocket in self._connections:
-                self._connections.remove(websocket)
+        entry = self._connections.pop(websocket, None)
+        if entry is not None:
+            entry[1].cancel()
         logger.info(f"WebSocket disconnected. Total connections: {len(self._connections)}")
 
     async def broadcast(self, message: dict[str, Any]) -> None:
         """Broadcast a message to all connected clients."""
         if not self._connections:
             return
+        await self.broadcast_text(orjson.dumps(message).decode())
+
+    async def broadcast_text(self, text: str) -> None:
+        """Broadcast an already serialized JSON message to all connected clients.
+
+        Serializing once up front avoids send_json re-encoding the same
+        message for every connection. The message is only queued here; each
+        client's sender task delivers it, so a slow client never holds up
+        the others.
+        """
+        overflowed: list[WebSocket] = []
+        for websocket, (queue, _) in self._connections.items():
+            try:
+                queue.put_nowait(text)
+            except asyncio.QueueFull:
+                overflowed.append(websocket)
 
-        # Create tasks for all sends
-        async with self._lock:
-            connections = self._connections.copy()
-
-        disconnected: list[WebSocket] = []
+        for websocket in overflowed:
+            logger.warning(f"WebSocket fell {SEND_QUEUE_SIZE} messages behind, disconnecting")
+            self._drop(websocket, cancel_sender=True)
 
-        for websocket in connections:
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.warning(f"Failed to send to WebSocket: {e}")
-                disconnected.append(websocket)
+    async def _run_sender(self, websocket: WebSocket, queue: asyncio.Queue[str]) -> None:
+        """Deliver one client's queued messages in order until it fails."""
+        try:
+            while True:
+                text = await queue.get()
+                await asyncio.wait_for(websocket.send_text(text), SEND_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.warning(f"Failed to send to WebSocket: {e!r}")
+            self._drop(websocket, cancel_sender=False)
 
-        # Remove disconnected clients
-        if disconnected:
-            async with self._lock:
-                for ws in disconnected:
-                    if ws in self._connections:
-                        self._connections.remove(ws)
+    def _drop(self, websocket: WebSocket, cancel_sender: bool) -> None:
+        """Forget a client and close its socket so it reconnects."""
+        entry = self._connections.pop(websocket, None)
+        if entry is None:
+            return
+        if cancel_sender:
+            entry[1].cancel()
+        asyncio.ensure_future(_close_quietly(websocket))
 
     async def broadcast_event(self, event: USBEvent) -> None:
         """Broadcast a USB event to all clients."""
-        message = event.to_websocket_message()
-        await self.broadcast(message)
+        if not self._connections:
+            return  # Nobody to render the event for
+        await self.broadcast_text(event.to_websocket_json())
+
+    def queue_event(self, event: USBEvent) -> None:
+        """Queue a USB event for broadcast by run_event_sender().
+
+        Must be called on the event loop thread (use call_soon_threadsafe
+        from other threads).
+        """
+        self._event_queue.put_nowait(event)
+
+    async def run_event_sender(self) -> None:
+        """Broadcast queued events, batching bursts into a single frame.
+
+        Waits for the first event, then drains whatever else has queued up
+        meanwhile (e.g. a hub and all its children enumerating) and sends
+        them together as one "batch" message.
+        """
+        while True:
+            events = [await self._event_queue.get()]
+            while not self._event_queue.empty():
+                events.append(self._event_queue.get_nowait())
+
+            if not self._connections:
+                continue
+
+            try:
+                if len(events) == 1:
+                    await self.broadcast_event(events[0])
+                else:
+                    await self.broadcast({
+                        "type": "batch",
+                        "events": [event.to_websocket_message() for event in events],
+                    })
+            except Exception as e:
+                logger.exception(f"Error broadcasting events: {e}")
 
     @property
     def connection_count(self) -> int:
@@ -82,6 +148,14 @@ class WebSocketManager:
             return False
 
 
+async def _close_quietly(websocket: WebSocket) -> None:
+    """Close a WebSocket that may already be gone."""
+    try:
+        await websocket.close(code=1013)  # Try again later
+    except Exception:
+        pass
+
+
 # Global WebSocket manager instance
 _ws_manager: WebSocketManager | None = None
 
@@ -0,0 +1,88 @@
+"""Tests for ConfigManager's debounced saving."""
+
+import asyncio
+
+import pytest
+
+from usb_explorer import config_manager as config_module
+from usb_explorer.config_manager import ConfigManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return ConfigManager(tmp_path / "config" / "devices.yaml")
+
+
+@pytest.fixture
+def saves(manager, monkeypatch):
+    """Count the manager's writes to disk."""
+    calls = []
+    save = manager.save
+
+    def counting_save():
+        calls.append(manager.version)
+        save()
+
+    monkeypatch.setattr(manager, "save", counting_save)
+    return calls
+
+
+def test_saves_immediately_without_event_loop(manager, saves):
+    manager.set_device_name("046d", "c52b", "Receiver")
+
+    assert len(saves) == 1
+    assert manager.config_path.exists()
+    assert ConfigManager(manager.config_path).get_device_name("046d", "c52b") == "Receiver"
+
+
+def test_burst_of_edits_is_saved_once_on_flush(manager, saves):
+    async def edit():
+        manager.set_device_name("046d", "c52b", "Receiver")
+        manager.set_hub_label("05e3:0610", "Desk hub")
+        manager.set_device_name("046d", "c52b", "Unifying receiver")
+        assert saves == []
+        assert not manager.config_path.exists()
+        manager.flush()
+
+    asyncio.run(edit())
+
+    assert len(saves) == 1
+    reloaded = ConfigManager(manager.config_path)
+    assert reloaded.get_device_name("046d", "c52b") == "Unifying receiver"
+    assert reloaded.get_hub_labels() == {"05e3:0610": "Desk hub"}
+
+
+def test_deferred_save_runs_after_delay(manager, saves, monkeypatch):
+    monkeypatch.setattr(config_module, "SAVE_DELAY_SECONDS", 0.01)
+
+    async def edit():
+        manager.set_hub_label("05e3:0610", "Desk hub")
+        manager.set_hub_label("05e3:0626", "Monitor hub")
+        await asyncio.sleep(0.05)
+
+    asyncio.run(edit())
+
+    assert len(saves) == 1
+    assert ConfigManager(manager.config_path).get_hub_labels() == {
+        "05e3:0610": "Desk hub",
+        "05e3:0626": "Monitor hub",
+    }
+
+
+def test_flush_without_changes_does_not_write(manager, saves):
+    manager.flush()
+
+    assert saves == []
+    assert not manager.config_path.exists()
+
+
+def test_version_changes_on_every_edit(manager):
+    async def edit():
+        before = manager.version
+        manager.set_hub_label("05e3:0610", "Desk hub")
+        after_first = manager.version
+        manager.set_hub_label("05e3:0610", None)
+        assert before < after_first < manager.version
+        manager.flush()
+
+    asyncio.run(edit())
@@ -0,0 +1,83 @@
+"""Tests for dmesg error parsing and per-port error lookup."""
+
+from usb_explorer.dmesg_parser import (
+    USBError,
+    errors_for_port,
+    get_errors_for_device,
+    index_errors,
+    parse_dmesg_line,
+)
+
+
+def make_error(port_path: str, message: str, severity: str = "error") -> USBError:
+    return USBError(timestamp=0.0, port_path=port_path, message=message, raw_line="", severity=severity)
+
+
+def test_parse_dmesg_line_matches_device_error():
+    error = parse_dmesg_line("[  12.345] usb 1-1.2: device descriptor read/64, error -71")
+
+    assert error is not None
+    assert error.port_path == "1-1.2"
+    assert error.message == "Device descriptor read failed"
+    assert error.severity == "error"
+
+
+def test_parse_dmesg_line_normalises_hub_port():
+    error = parse_dmesg_line("usb usb3-port2: cannot reset (err = -110)")
+
+    assert error is not None
+    assert error.port_path == "3-2"
+    assert error.message == "Port cannot reset"
+
+
+def test_parse_dmesg_line_downgrades_warnings():
+    error = parse_dmesg_line("usb 2-1: over-current warning on port")
+
+    assert error is not None
+    assert error.severity == "warning"
+
+
+def test_parse_dmesg_line_ignores_unrelated_lines():
+    assert parse_dmesg_line("EXT4-fs (sda1): mounted filesystem") is None
+    assert parse_dmesg_line("usb 1-1: new high-speed USB device number 2 using xhci_hcd") is None
+
+
+def test_errors_for_port_merges_ancestors_in_logged_order():
+    index = index_errors([
+        make_error("1-1.2", "first"),
+        make_error("1-1", "second"),
+        make_error("1-3", "unrelated"),
+        make_error("1-1.2", "third"),
+        make_error("1-1", "fourth", severity="warning"),
+    ])
+
+    assert errors_for_port(index, "1-1.2") == [
+        "[ERROR] first",
+        "[ERROR] second",
+        "[ERROR] third",
+        "[WARNING] fourth",
+    ]
+    assert errors_for_port(index, "1-1") == ["[ERROR] second", "[WARNING] fourth"]
+
+
+def test_errors_for_port_keeps_first_of_repeated_messages():
+    index = index_errors([
+        make_error("1-1", "reset"),
+        make_error("1-1.4", "descriptor"),
+        make_error("1-1", "reset"),
+    ])
+
+    assert errors_for_port(index, "1-1.4") == ["[ERROR] reset", "[ERROR] descriptor"]
+
+
+def test_errors_for_port_without_matches():
+    assert errors_for_port({}, "1-1") == []
+    assert errors_for_port(index_errors([make_error("2-1", "x")]), "1-1") == []
+    # "1-10" is not below "1-1"
+    assert errors_for_port(index_errors([make_error("1-1", "x")]), "1-10") == []
+
+
+def test_get_errors_for_device_matches_index_lookup():
+    errors = [make_error("1-1", "a"), make_error("1-1.1", "b"), make_error("1-1", "c")]
+
+    assert get_errors_for_device("1-1.1", errors) == ["[ERROR] a", "[ERROR] b", "[ERROR] c"]
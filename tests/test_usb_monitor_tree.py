@@ -0,0 +1,114 @@
+"""Tests for the incrementally maintained USB device tree."""
+
+import pytest
+
+from usb_explorer.models import DeviceClass, USBDevice
+from usb_explorer.usb_monitor import USBMonitor, _parent_port_path, _port_sort_key
+
+
+def make_device(port_path: str, device_class: DeviceClass = DeviceClass.UNKNOWN) -> USBDevice:
+    is_root_hub = port_path.startswith("usb")
+    return USBDevice(
+        bus=int(port_path[3:] if is_root_hub else port_path.partition("-")[0]),
+        device=1,
+        port_path=port_path,
+        vendor_id="1d6b" if is_root_hub else "046d",
+        product_id="0002" if is_root_hub else "c52b",
+        device_class=DeviceClass.HUB if is_root_hub else device_class,
+        is_root_hub=is_root_hub,
+        parent_path=None if is_root_hub else _parent_port_path(port_path),
+    )
+
+
+def paths(devices: list[USBDevice]) -> list[str]:
+    return [d.port_path for d in devices]
+
+
+@pytest.fixture
+def monitor() -> USBMonitor:
+    return USBMonitor()
+
+
+def install(monitor: USBMonitor, port_paths: list[str]) -> None:
+    devices = [make_device(p) for p in port_paths]
+    monitor._devices = {d.port_path: d for d in devices}
+    monitor._tree_roots = monitor._build_tree(devices)
+
+
+def test_port_sort_key_orders_ports_numerically():
+    assert _port_sort_key("usb5") == (5,)
+    assert _port_sort_key("5-1.2.10") == (5, 1, 2, 10)
+    assert sorted(["1-1.10", "1-1.2", "1-1"], key=_port_sort_key) == ["1-1", "1-1.2", "1-1.10"]
+    assert _port_sort_key("not-a-port") == ()
+
+
+def test_parent_port_path():
+    assert _parent_port_path("5-1.2.4") == "5-1.2"
+    assert _parent_port_path("5-1") == "usb5"
+    assert _parent_port_path("usb5") is None
+
+
+def test_build_tree_links_children_in_port_order(monitor):
+    install(monitor, ["1-1.10", "usb2", "1-1", "1-1.2", "usb1", "2-3"])
+
+    usb1, usb2 = monitor._tree_roots
+    assert (usb1.port_path, usb2.port_path) == ("usb1", "usb2")
+    assert paths(usb1.children) == ["1-1"]
+    assert paths(usb1.children[0].children) == ["1-1.2", "1-1.10"]
+    assert paths(usb2.children) == ["2-3"]
+
+
+def test_build_tree_makes_orphans_roots(monitor):
+    install(monitor, ["usb1", "1-1.2.3"])
+
+    assert paths(monitor._tree_roots) == ["usb1", "1-1.2.3"]
+    assert monitor._tree_roots[0].children == []
+
+
+def test_attach_inserts_in_port_order(monitor):
+    install(monitor, ["usb1", "1-1", "1-1.1", "1-1.10"])
+
+    monitor._attach(make_device("1-1.3"))
+
+    hub = monitor._devices["1-1"]
+    assert paths(hub.children) == ["1-1.1", "1-1.3", "1-1.10"]
+    assert "1-1.3" in monitor._devices
+
+
+def test_attach_replacement_takes_over_subtree(monitor):
+    install(monitor, ["usb1", "1-1", "1-1.1", "1-1.2"])
+    old_hub = monitor._devices["1-1"]
+
+    new_hub = make_device("1-1", DeviceClass.HUB)
+    monitor._attach(new_hub)
+
+    assert monitor._devices["1-1"] is new_hub
+    assert monitor._tree_roots[0].children == [new_hub]
+    assert new_hub.children is old_hub.children
+    assert paths(new_hub.children) == ["1-1.1", "1-1.2"]
+    assert monitor._hubs == {"1-1": new_hub}
+
+
+def test_attach_without_parent_goes_to_roots(monitor):
+    install(monitor, ["usb1"])
+
+    monitor._attach(make_device("1-4.2"))
+
+    assert paths(monitor._tree_roots) == ["usb1", "1-4.2"]
+
+
+def test_detach_unlinks_from_parent(monitor):
+    install(monitor, ["usb1", "1-1", "1-1.1", "1-1.2"])
+    device = monitor._devices["1-1.1"]
+
+    monitor._detach(device)
+
+    assert paths(monitor._devices["1-1"].children) == ["1-1.2"]
+
+
+def test_detach_removes_orphan_root(monitor):
+    install(monitor, ["usb1", "1-4.2"])
+
+    monitor._detach(monitor._devices["1-4.2"])
+
+    assert paths(monitor._tree_roots) == ["usb1"]
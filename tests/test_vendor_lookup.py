@@ -0,0 +1,119 @@
+"""Tests for the usb.ids parser and its on-disk cache."""
+
+import marshal
+
+import pytest
+
+from usb_explorer import vendor_lookup
+from usb_explorer.vendor_lookup import USBIDDatabase, _parse_id
+
+USB_IDS = (
+    "# List of USB ID's\n"
+    "#\n"
+    "0001  Fry's Electronics\n"
+    "\t7778  Counterfeit flash drive [Kingston]\n"
+    "046d  Logitech, Inc.\n"
+    "\tc52b  Unifying Receiver\n"
+    "# A comment between products\n"
+    "\t085e  BRIO Ultra HD Webcam  \n"
+    "05e3  Genesys Logic, Inc.\n"
+    "\t0610  Hub\n"
+    "\t0610  Hub (later entries win)\n"
+    "\n"
+    "C 09  Hub\n"
+    "\t00  Unused\n"
+)
+
+
+@pytest.fixture
+def usb_ids(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.delenv("USB_EXPLORER_NO_CACHE", raising=False)
+    path = tmp_path / "usb.ids"
+    path.write_text(USB_IDS)
+    return path
+
+
+def load(path) -> USBIDDatabase:
+    db = USBIDDatabase()
+    assert db.load(str(path))
+    return db
+
+
+def test_parse_id_accepts_only_four_hex_digits():
+    assert _parse_id("046d") == 0x046D
+    assert _parse_id("046D") == 0x046D
+    for value in ("46d", "0046d", "0x6d", "+46d", " 46d", "04_d", "zzzz", None):
+        assert _parse_id(value) is None
+
+
+def test_lookup_vendors_and_products(usb_ids):
+    db = load(usb_ids)
+
+    assert db.get_vendor("046d") == "Logitech, Inc."
+    assert db.get_vendor("046D") == "Logitech, Inc."
+    assert db.get_product("046d", "c52b") == "Unifying Receiver"
+    # Products continue past comment lines; trailing whitespace is dropped
+    assert db.get_product("046d", "085e") == "BRIO Ultra HD Webcam"
+    assert db.get_product("05e3", "0610") == "Hub (later entries win)"
+    assert db.lookup("0001", "7778") == ("Fry's Electronics", "Counterfeit flash drive [Kingston]")
+
+
+def test_lookup_misses(usb_ids):
+    db = load(usb_ids)
+
+    assert db.get_vendor("ffff") is None
+    assert db.get_product("046d", "ffff") is None
+    assert db.lookup("046d", "bad!") == ("Logitech, Inc.", None)
+    assert db.lookup("bad!", "c52b") == (None, None)
+    # Class definitions end the vendor list; their entries aren't products
+    assert db.get_product("05e3", "0000") is None
+
+
+def test_cache_is_used_on_second_load(usb_ids, monkeypatch):
+    load(usb_ids)
+    assert vendor_lookup._cache_path().exists()
+
+    def fail(self, path):
+        raise AssertionError("usb.ids parsed despite a valid cache")
+
+    monkeypatch.setattr(USBIDDatabase, "_parse_usb_ids", fail)
+    db = load(usb_ids)
+    assert db.get_product("046d", "c52b") == "Unifying Receiver"
+
+
+def test_stale_cache_is_reparsed(usb_ids):
+    load(usb_ids)
+    usb_ids.write_text(USB_IDS + "1d6b  Linux Foundation\n")
+
+    db = load(usb_ids)
+
+    assert db.get_vendor("1d6b") == "Linux Foundation"
+
+
+@pytest.mark.parametrize("damage", ["garbage", "truncated_offsets"])
+def test_corrupt_cache_is_reparsed_and_rewritten(usb_ids, damage):
+    load(usb_ids)
+    cache_path = vendor_lookup._cache_path()
+    if damage == "garbage":
+        cache_path.write_bytes(b"not a marshal file")
+    else:
+        key, vendors, products = marshal.loads(cache_path.read_bytes())
+        vendors = (vendors[0], vendors[1][:-4], vendors[2])
+        cache_path.write_bytes(marshal.dumps((key, vendors, products)))
+
+    db = load(usb_ids)
+
+    assert db.get_vendor("046d") == "Logitech, Inc."
+    key, vendors, products = marshal.loads(cache_path.read_bytes())
+    assert len(vendors[1]) == len(vendors[0]) + 4  # One offset per key, plus the end
+
+
+def test_empty_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("USB_EXPLORER_NO_CACHE", "1")
+    path = tmp_path / "usb.ids"
+    path.write_bytes(b"")
+
+    db = load(path)
+
+    assert db.get_vendor("046d") is None